@@ -1,65 +1,373 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import datetime
-import requests
-import matplotlib.pyplot as plt
-from env import url
-import webbrowser
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait
+from env import (url, cache_ttl, cache_max_entries, pool_size, connect_timeout,
+                 read_timeout, retrieve_all_read_timeout, max_retries,
+                 retry_budget_ratio, breaker_failures, breaker_reset,
+                 fetch_deadline, offline, error_queue_size, error_batch_size,
+                 error_flush_interval, error_spill_path, chart_mode)
+from cache import TTLCache
+from http_client import (BackendClient, RetryBudget, CircuitBreaker,
+                         collect_failures)
+from error_engine import ErrorAccumulator
+from error_reporter import ErrorReporter
+from rollup import Rollup
+from history import PayloadHistory, rows_nbytes
+from store import (load_compact, series_footprint, memory_footprint as
+                   store_footprint)
+from series import AQI_BOUNDS, AQISeries, aqi_class_codes
+from render import render_line_chart
+from charts import chart_frame, line_chart_spec
+from instrumentation import timed, annotate, submit_traced
+from aqi_scale import AQI_CLASSES, AQI_COLORS
+from helpers import redirect
+
+#shared across all sessions of the streamlit server process
+response_cache = TTLCache(cache_ttl, cache_max_entries)
+client = BackendClient(url,
+                       pool_size=pool_size,
+                       timeout=(connect_timeout, read_timeout),
+                       endpoint_timeouts={
+                           '/retrieve_all':
+                               (connect_timeout, retrieve_all_read_timeout)
+                       },
+                       max_retries=max_retries,
+                       retry_budget=RetryBudget(retry_budget_ratio),
+                       breaker=CircuitBreaker(breaker_failures, breaker_reset))
+histories = {}
+histories_lock = threading.Lock()
+error_accumulators = {}
+error_accumulators_lock = threading.Lock()
+rollups = {}
+rollups_lock = threading.Lock()
+#compact series of every city refreshed in the background, replaced whole.
+#The payloads they were built from tell whether the next refresh changed
+#anything.
+Snapshot = namedtuple('Snapshot',
+                      ['real', 'predicted', 'refreshed_at', 'payloads'])
+snapshots = {}
+snapshots_lock = threading.Lock()
+error_reporter = ErrorReporter(lambda *sample: insert_error_data(*sample),
+                               max_queue=error_queue_size,
+                               batch_size=error_batch_size,
+                               flush_interval=error_flush_interval,
+                               spill_path=error_spill_path)
+fetch_pool = ThreadPoolExecutor(max_workers=pool_size,
+                                thread_name_prefix='aqi-fetch')
+#cleaned frames, keyed by the identity of the payload or series they were
+#built from. A 304 hands back the same payload, so its frame is reused.
+frame_cache = TTLCache(cache_ttl, cache_max_entries)
+
+
+def _cached_frame(source, key, build):
+    '''
+        Build a frame from source once per source object and key. The
+        source is kept with the frame so that its id is not reused while
+        cached. Cached frames are shared and must not be modified.
+    '''
+    if source is None:
+        return build()
+    return frame_cache.get_or_load((id(source), *key), lambda:
+                                   (source, build()))[1]
+
+
+def get_history(endpoint, city, state):
+    '''
+        Get the shared row history of an endpoint for a city
+    '''
+    with histories_lock:
+        key = (endpoint, city.lower(), state.lower())
+        if key not in histories:
+            histories[key] = PayloadHistory()
+        return histories[key]
+
+
+def _load_window(endpoint, city, state, fetch, datetime_start, datetime_end):
+    '''
+        Sync the history of an endpoint at most once per cache ttl and
+        return the requested window of it
+    '''
+    history = get_history(endpoint, city, state)
+    loaded = response_cache.get_or_load(
+        (endpoint, city, state, datetime_start),
+        lambda: history.sync(fetch, datetime_start) or None)
+    if loaded is None:
+        return None
+    return history.window(datetime_start, datetime_end)
 
 
 #helper function to get real time aqi from backend
-def get_real_time_aqi(city, state):
+@timed('get_real_time_aqi')
+def get_real_time_aqi(city, state, datetime_start=None, datetime_end=None):
     '''
-        Get the real time AQI for a city
+        Get the real time AQI for a city, optionally only between
+        datetime_start and datetime_end
     '''
+    return _load_window(
+        'retrieve', city, state,
+        lambda params: _fetch_real_time_aqi(city, state, params),
+        datetime_start, datetime_end)
 
-    response = requests.get(f"{url}/retrieve",
-                            params={
-                                'city': city,
-                                'state': state
-                            })
 
-    if response.status_code == 200:
+def _fetch_real_time_aqi(city, state, window):
+    '''
+        Fetch the real time AQI for a city from the backend
+    '''
+    return client.get_json('/retrieve',
+                           params={
+                               'city': city,
+                               'state': state,
+                               **window
+                           })
 
-        return response.json()
-    else:
-        return None
+
+@timed('get_predicted_aqi')
+def get_predicted_aqi(city, state, datetime_start=None, datetime_end=None):
+    '''
+        Get the predicted AQI for a city, optionally only between
+        datetime_start and datetime_end
+    '''
+    return _load_window(
+        'retrieve_all', city, state,
+        lambda params: _fetch_predicted_aqi(city, state, params),
+        datetime_start, datetime_end)
 
 
-def get_predicted_aqi(city, state):
+def _fetch_predicted_aqi(city, state, window):
     '''
-        Get the predicted AQI for a city
+        Fetch the predicted AQI for a city from the backend
     '''
-    response = requests.get(f"{url}/retrieve_all",
-                            params={
-                                'city': city.lower(),
-                                'state': state.lower(),
-                            })
-    if response.status_code == 200:
-        return response.json()
+    return client.get_json('/retrieve_all',
+                           params={
+                               'city': city.lower(),
+                               'state': state.lower(),
+                               **window
+                           })
+
+
+@timed('fetch_aqi_data')
+def fetch_aqi_data(city,
+                   state,
+                   datetime_start=None,
+                   datetime_end=None,
+                   deadline=fetch_deadline):
+    '''
+        Fetch the real time and predicted AQI at the same time.
+        Whichever side fails or misses the deadline is returned as None.
+    '''
+    futures = [
+        submit_traced(fetch_pool, get_real_time_aqi, city, state,
+                      datetime_start, datetime_end),
+        submit_traced(fetch_pool, get_predicted_aqi, city, state)
+    ]
+    wait(futures, timeout=deadline)
+
+    results = []
+    for future in futures:
+        if future.done() and future.exception() is None:
+            results.append(future.result())
+        else:
+            results.append(None)
+    return results[0], results[1]
+
+
+def get_snapshot(city, state):
+    '''
+        Get the background refreshed series of a city, None if there are none
+    '''
+    with snapshots_lock:
+        return snapshots.get((city.lower(), state.lower()))
+
+
+@timed('refresh_city')
+def refresh_city(city, state):
+    '''
+        Fetch and clean all the data of a city and swap it in for the reruns
+        to read. Until this succeeds the previous frames keep being served.
+        Returns False if the data could not be fetched, also when the last
+        good data was served because the backend could not revalidate it.
+    '''
+    #revalidate with the backend, whatever the response cache holds
+    for endpoint in ('retrieve', 'retrieve_all'):
+        response_cache.invalidate((endpoint, city, state, None))
+    with collect_failures() as failures:
+        aqi_data, predicted_aqi = fetch_aqi_data(city, state)
+    if failures or aqi_data is None or predicted_aqi is None:
+        return False
+
+    previous = get_snapshot(city, state)
+    if (previous is not None and previous.payloads[0] is aqi_data and
+            previous.payloads[1] is predicted_aqi):
+        #nothing changed (the backend answered 304), keep the same series
+        #so the frames built from them stay cached
+        snapshot = previous._replace(refreshed_at=datetime.datetime.now())
     else:
-        return None
+        df, _, _, _ = clean_real_time_aqi(aqi_data, None, None)
+        df_pred = clean_prediction_data(predicted_aqi)
+        if df is None or df_pred is None:
+            return False
+        snapshot = Snapshot(AQISeries.from_frame(df),
+                            AQISeries.from_frame(df_pred),
+                            datetime.datetime.now(), (aqi_data, predicted_aqi))
+    with snapshots_lock:
+        snapshots[(city.lower(), state.lower())] = snapshot
+    #bring the model error and the rollups up to date as well
+    calculate_city_error(city, state)
+    return True
+
+
+def load_city_series(city, state):
+    '''
+        Real time and predicted AQI of a city as shared AQISeries, from the
+        background refresh or the local store. Either can be None.
+    '''
+    snapshot = get_snapshot(city, state)
+    if snapshot is not None:
+        return snapshot.real, snapshot.predicted
+    return (load_compact('real_time', city,
+                         state), load_compact('predicted', city, state))
 
 
-def clean_real_time_aqi(aqi_data, datetime_start, datetime_end):
+def latest_real_time(city, state):
+    '''
+        Newest hour with a real time AQI in all the data of a city, whatever
+        date range is selected. None if nothing is loaded yet.
+    '''
+    real, _ = load_city_series(city, state)
+    if real is not None and len(real):
+        return pd.Timestamp(np.datetime64(int(real.hours[-1]), 'h'))
+    high_water = get_history('retrieve', city, state).high_water
+    if high_water is not None:
+        return pd.Timestamp(high_water).floor('H')
+    return None
+
+
+#kind of series every backend endpoint returns
+ENDPOINT_KINDS = {'retrieve': 'real_time', 'retrieve_all': 'predicted'}
+
+
+def memory_footprint():
+    '''
+        Rows and bytes held in memory for every city: the series of the
+        store and of the background refresh, and on the backend path the
+        row history and the last good responses of the client. Rows shared
+        by the history and a response are counted once.
+    '''
+    report = store_footprint()
+    with snapshots_lock:
+        current = sorted(snapshots.items())
+    for (city, state), snapshot in current:
+        report.append(
+            series_footprint(snapshot.real, 'real_time', city, state,
+                             'snapshot'))
+        report.append(
+            series_footprint(snapshot.predicted, 'predicted', city, state,
+                             'snapshot'))
+
+    seen = set()
+    with histories_lock:
+        current = sorted(histories.items())
+    for (endpoint, city, state), history in current:
+        rows, nbytes = history.footprint(seen)
+        report.append({
+            'city': city,
+            'state': state,
+            'kind': ENDPOINT_KINDS[endpoint],
+            'source': 'history',
+            'rows': rows,
+            'bytes': nbytes,
+            'dataframe_bytes': None,
+        })
+    for endpoint, params, payload in client.last_good_payloads():
+        report.append({
+            'city': params.get('city', '').lower(),
+            'state': params.get('state', '').lower(),
+            'kind': ENDPOINT_KINDS.get(endpoint.lstrip('/'), endpoint),
+            'source': 'last good response',
+            'rows': len(payload['data']),
+            'bytes': rows_nbytes(payload['data'], seen),
+            'dataframe_bytes': None,
+        })
+    return report
+
+
+@timed('load_aqi_frames')
+def load_aqi_frames(city, state, datetime_start, datetime_end):
+    '''
+        Get the cleaned real time and predicted AQI of a city between the
+        start and end date. The background refreshed frames or the local
+        store are used when they have the data, the backend only when they
+        do not (and never in offline mode).
+    '''
+    real, predicted = load_city_series(city, state)
+    df = df_pred = None
+
+    #only the window is turned into a frame, with the stored classes, once
+    #per series and window
+    if real is not None:
+        df = _cached_frame(
+            real, ('window', datetime_start, datetime_end), lambda: real.window(
+                datetime_start, datetime_end).to_frame(with_class=True))
+        current_datetime = datetime.datetime.now()
+    if predicted is not None:
+        df_pred = _cached_frame(predicted, ('frame',),
+                                lambda: predicted.to_frame(with_class=True))
+    if (df is None or df_pred is None) and not offline:
+        aqi_data, predicted_aqi = fetch_aqi_data(city, state, datetime_start,
+                                                 datetime_end)
+        if df is None:
+            df, current_datetime, _, _ = _cached_frame(
+                aqi_data, ('real_time', datetime_start, datetime_end), lambda:
+                clean_real_time_aqi(aqi_data, datetime_start, datetime_end))
+        if df_pred is None:
+            df_pred = _cached_frame(
+                predicted_aqi, ('predicted',),
+                lambda: clean_prediction_data(predicted_aqi))
+    if df is None:
+        current_datetime = None
+    return df, current_datetime, df_pred
+
+
+def parse_aqi_payload(aqi_data, value_key):
+    '''
+        Parse the rows of a backend payload into a typed dataframe
+        with date_time and aqi columns
+    '''
+
+    #build both columns in one pass over the records
+    df = pd.DataFrame.from_records(aqi_data['data'],
+                                   columns=['datetime', value_key])
+    df.columns = ['date_time', 'aqi']
+
+    #parse all timestamps in a single vectorized call
+    df['date_time'] = pd.to_datetime(df['date_time'],
+                                     format='%d/%m/%Y %H:%M:%S')
+    df['aqi'] = pd.to_numeric(df['aqi'])
+    return df
 
-    #check if valid data is returned
-    if aqi_data is not None:
-        aqi = []
-        date_time = []
 
-        #iterate through the data and append to the lists
-        for data in aqi_data['data']:
-            aqi.append(data['aqi'])
-            date_time.append(data['datetime'])
+def clean_real_time_frame(df, keys=()):
+    '''
+        Clean parsed real time rows, keys are extra columns (like city)
+        that identify a series in a long format frame
+    '''
+    #convert minutes to 0 for consistency
+    df['date_time'] = df['date_time'].dt.floor('H')
+
+    #drop the duplicate rows
+    return df.drop_duplicates(subset=[*keys, 'date_time'], keep='last')
+
 
-        #convert the lists to pandas dataframe
-        df = pd.DataFrame(list(zip(date_time, aqi)),
-                          columns=['date_time', 'aqi'])
+@timed('clean_real_time_aqi')
+def clean_real_time_aqi(aqi_data, datetime_start, datetime_end):
 
-        #convert the date_time column to datetime
-        df['date_time'] = pd.to_datetime(df['date_time'],
-                                         format='%d/%m/%Y %H:%M:%S')
+    #check if valid data is returned
+    if aqi_data is not None:
+        df = parse_aqi_payload(aqi_data, 'aqi')
 
         #select the data between the start and end date
         # df = df[(df['date_time'] >= datetime_start) &
@@ -74,48 +382,69 @@ def clean_real_time_aqi(aqi_data, datetime_start, datetime_end):
             #find how many hours ago the data was updated
             minutes_ago = (current_datetime - last_updated).seconds // 60
 
-            df['date_time'] = df['date_time'].dt.strftime('%d-%m-%Y %H:%M')
-
-            #convert minutes to 0 for consistency
-            df['date_time'] = df['date_time'].apply(lambda x: x[:-2] + '00')
-
-            #drop the duplicate rows
-            df = df.drop_duplicates(subset=['date_time'], keep='last')
+            df = clean_real_time_frame(df)
+            annotate(rows=len(df))
             return df, current_datetime, last_updated, minutes_ago
 
         return None, None, None, None
     return None, None, None, None
 
 
+def format_for_display(df, column='date_time'):
+    '''
+        Return a copy of the dataframe with a readable date_time column
+    '''
+    df = df.copy()
+    df[column] = df[column].dt.strftime('%d-%m-%Y %H:%M')
+    return df
+
+
+def show_line_chart(x, lines, title, xlabel):
+    '''
+        Show one or more lines sharing the same x values, drawn by the
+        browser in the interactive chart mode, as an image otherwise
+    '''
+    if st.session_state.get('chart_mode', chart_mode) == 'interactive':
+        st.vega_lite_chart(chart_frame(x, lines),
+                           line_chart_spec(title, xlabel),
+                           use_container_width=True)
+    else:
+        st.image(render_line_chart(x, lines, title, xlabel),
+                 use_column_width=True)
+
+
+@timed('plot_single_data')
 def plot_single_data(df, title):
     '''
         Plot the data for a single dataframe
     '''
-    df['date_time'] = pd.to_datetime(df['date_time'], format='%d-%m-%Y %H:%M')
     #plot the data
-    plt.plot(df['date_time'], df['aqi'])
-    plt.xlabel('Time')
-    plt.ylabel('AQI')
-    plt.title(title)
+    show_line_chart(df['date_time'], [(df['aqi'], None)], title, 'Time')
 
-    #show only first, middle and last label on x axis
-    plt.xticks([
-        df['date_time'].iloc[0],
-        df['date_time'].iloc[int(len(df['date_time']) / 2)],
-        df['date_time'].iloc[-1]
-    ])
 
-    #show the plot
-    st.pyplot()
+#predictions are only kept on the hour from this date on
+PREDICTION_HOURLY_SINCE = pd.Timestamp(2022, 12, 9)
 
 
-def redirect(_url):
+def clean_prediction_frame(df, keys=()):
     '''
-        Redirect to a url
+        Clean parsed prediction rows, keys are extra columns (like city)
+        that identify a series in a long format frame
     '''
-    webbrowser.open_new_tab(_url)
+    #whereever date is greater than 9th december 2022, only select the data where minutes are 00
+    before_9_dec_2022 = df['date_time'] < PREDICTION_HOURLY_SINCE
+    on_the_hour = df['date_time'].dt.minute == 0
+
+    #convert minutes to 0 for consistency
+    df['date_time'] = df['date_time'].dt.floor('H')
+    df = df[before_9_dec_2022 | on_the_hour]
 
+    #drop the duplicate rows
+    return df.drop_duplicates(subset=[*keys, 'date_time'],
+                              keep='last').reset_index(drop=True)
 
+
+@timed('clean_prediction_data')
 def clean_prediction_data(aqi_data):
     '''
         Clean the prediction data
@@ -123,162 +452,173 @@ def clean_prediction_data(aqi_data):
 
     #check if valid data is returned
     if aqi_data is not None:
-        predicted_aqi = aqi_data['data']
-        date_time = []
-        aqi = []
-
-        #iterate through the data and append to the lists
-        for data in predicted_aqi:
-            date_time.append(
-                pd.to_datetime(data['datetime'], format='%d/%m/%Y %H:%M:%S'))
-            aqi.append(data['yhat'])
-
-        #convert the lists to pandas dataframe
-        df = pd.DataFrame(list(zip(date_time, aqi)),
-                          columns=['date_time', 'aqi'])
+        df = parse_aqi_payload(aqi_data, 'yhat')
 
         if not df.empty:
-
-            df['date_time'] = df['date_time'].dt.strftime('%d-%m-%Y %H:%M')
-            #whereever date is greater than 9th december 2022, only select the data where seconds are 00
-            df_greater_9_dec_2022 = df[df['date_time'] >= '09-12-2022 00:00']
-            #select the data where seconds are 00
-            df_greater_9_dec_2022 = df_greater_9_dec_2022[
-                df_greater_9_dec_2022['date_time'].apply(
-                    lambda x: x[-2:]) == '00']
-            #merge this data with the data where date is less than 9th december 2022
-            df = pd.concat([
-                df[df['date_time'] < '09-12-2022 00:00'], df_greater_9_dec_2022
-            ])
-
-            #convert minutes to 0 for consistency
-            df['date_time'] = df['date_time'].apply(lambda x: x[:-2] + '00')
-
-            #drop the duplicate rows
-            df = df.drop_duplicates(subset=['date_time'],
-                                    keep='last').reset_index(drop=True)
+            df = clean_prediction_frame(df)
+            annotate(rows=len(df))
             return df
         else:
             return None
     return None
 
 
+@timed('plot_multiple_data')
 def plot_multiple_data(df_combined):
     '''
         Plot the data for multiple dataframes
     '''
-    df_combined['date_time'] = pd.to_datetime(df_combined['date_time'],
-                                              format='%d-%m-%Y %H:%M')
-    #plot the data for real time aqi
-    plt.plot(df_combined['date_time'],
-             df_combined['aqi'],
-             label='Real Time AQI')
+    #plot the data for real time aqi and predicted aqi
+    show_line_chart(df_combined['date_time'],
+                    [(df_combined['aqi'], 'Real Time AQI'),
+                     (df_combined['aqi_pred'], 'Predicted AQI')],
+                    'Real Time AQI vs Predicted AQI', 'Date')
 
-    #plot the data for predicted aqi
-    plt.plot(df_combined['date_time'],
-             df_combined['aqi_pred'],
-             label='Predicted AQI')
 
-    #set the labels and other properties
-    plt.xticks([
-        df_combined['date_time'].iloc[0],
-        df_combined['date_time'].iloc[int(len(df_combined['date_time']) / 2)],
-        df_combined['date_time'].iloc[-1]
-    ])
-    plt.legend()
-    plt.xlabel('Date')
-    plt.ylabel('AQI')
-    plt.title('Real Time AQI vs Predicted AQI')
+def get_error_accumulator(city, state):
+    '''
+        Get the shared error accumulator of a city
+    '''
+    with error_accumulators_lock:
+        key = (city.lower(), state.lower())
+        if key not in error_accumulators:
+            error_accumulators[key] = ErrorAccumulator()
+        return error_accumulators[key]
 
-    #show the plot
-    st.pyplot()
 
+def get_rollup(city, state):
+    '''
+        Get the shared daily and weekly rollup of a city
+    '''
+    with rollups_lock:
+        key = (city.lower(), state.lower())
+        if key not in rollups:
+            rollups[key] = Rollup()
+        return rollups[key]
 
-def calculate_time_series_error(df_real, df_pred):
+
+def _next_hour(hour):
     '''
-        Calculate the error (MAPE) between the real time aqi and predicted aqi
+        The hour after a high-water mark, None when there is none
     '''
+    return None if hour is None else pd.Timestamp(hour) + pd.Timedelta(hours=1)
 
-    #merge the dataframes
-    df_pred = df_pred.rename(columns={'aqi': 'aqi_pred'})
-    df_combined = pd.merge(df_real, df_pred, on='date_time', how='inner')
 
-    #calculate the error
-    df_combined['error'] = abs(df_combined['aqi'] - df_combined['aqi_pred'])
-    df_combined['error'] = df_combined['error'] / df_combined['aqi']
-    df_combined['error'] = df_combined['error'] * 100
+@timed('calculate_city_error')
+def calculate_city_error(city, state):
+    '''
+        Calculate the error (MAPE) of a city over all its loaded data, only
+        cleaning the rows that arrived since the previous call. Never asks
+        the backend: without background refreshed or stored series it reads
+        the rows the page load already fetched under its deadline.
+        The new real time rows are also added to the rollup of the city.
+    '''
+    accumulator = get_error_accumulator(city, state)
+    real, predicted = load_city_series(city, state)
+    #only the hours newer than the ones already counted
+    if real is not None:
+        df_real = real.window(_next_hour(accumulator.real_until)).to_frame()
+    else:
+        df_real, _, _, _ = clean_real_time_aqi(
+            get_history('retrieve', city,
+                        state).window(since=accumulator.real_until), None, None)
+    if predicted is not None:
+        df_pred = predicted.window(_next_hour(
+            accumulator.pred_until)).to_frame()
+    else:
+        df_pred = clean_prediction_data(
+            get_history('retrieve_all', city,
+                        state).window(since=accumulator.pred_until))
+    if df_real is not None:
+        get_rollup(city, state).update(df_real)
+    return calculate_time_series_error(df_real, df_pred, accumulator)
 
-    #calculate the mean error
-    mape = df_combined['error'].mean()
 
-    #error for the last 24 hours
-    df_combined_last_24_hours = df_combined[df_combined['date_time'] >= (
-        datetime.datetime.now() -
-        datetime.timedelta(hours=24)).strftime('%d-%m-%Y %H:%M')]
-    mape_last_24_hours = df_combined_last_24_hours['error'].mean()
+@timed('get_city_rollups')
+def get_city_rollups(city, state):
+    '''
+        Daily and weekly statistics of a city with the model error of each
+        day and week. Kept up to date by calculate_city_error.
+    '''
+    errors = get_error_accumulator(city, state).daily_errors()
+    rollup = get_rollup(city, state)
+    return rollup.daily(errors), rollup.weekly(errors)
+
 
-    return mape, mape_last_24_hours
+@timed('plot_daily_data')
+def plot_daily_data(df_daily):
+    '''
+        Plot the daily mean, p95 and max AQI
+    '''
+    show_line_chart(df_daily['date'], [(df_daily['mean_aqi'], 'Mean AQI'),
+                                       (df_daily['p95_aqi'], 'P95 AQI'),
+                                       (df_daily['max_aqi'], 'Max AQI')],
+                    'Daily AQI', 'Date')
 
 
-def insert_error_data(city, state, mape):
+@timed('calculate_time_series_error')
+def calculate_time_series_error(df_real, df_pred, accumulator=None):
+    '''
+        Calculate the error (MAPE) between the real time aqi and predicted aqi.
+        With a shared accumulator only the rows that arrived since the
+        previous call are processed.
+    '''
+    if accumulator is None:
+        accumulator = ErrorAccumulator()
+    accumulator.update(df_real, df_pred)
+
+    #error for all the data and for the last 24 hours of it
+    return accumulator.mape(), accumulator.window_mape('24h')
+
+
+@timed('insert_error_data')
+def insert_error_data(city, state, mape, when=None):
     '''
         insert the error data into the database
     '''
-    #---FUTURE WORK---
-    response = requests.post(
-        f"{url}/insert_error",
-        params={
-            'city': city.lower(),
-            'state': state.lower(),
-            'mape': mape,
-            'datetime': datetime.datetime.now().strftime('%d/%m/%Y %H:%M:%S')
-        })
-    if response.status_code == 200:
-        return response.json()
-    else:
-        return None
-    #---FUTURE WORK---
+    when = when or datetime.datetime.now()
+    return client.post_json('/insert_error',
+                            params={
+                                'city': city.lower(),
+                                'state': state.lower(),
+                                'mape': mape,
+                                'datetime': when.strftime('%d/%m/%Y %H:%M:%S')
+                            })
+
+
+def report_error_data(city, state, mape):
+    '''
+        Queue the error data to be inserted in the background
+    '''
+    error_reporter.submit(city, state, mape)
+
+
+def classify_aqi(aqi):
+    '''
+        Get the categorical aqi class of every value in a series.
+        Missing values get a missing class.
+    '''
+    return pd.Categorical.from_codes(aqi_class_codes(aqi),
+                                     categories=AQI_CLASSES,
+                                     ordered=True)
 
 
 def get_aqi_class(aqi):
     '''
         Get the aqi class based on the aqi value
     '''
-
-    #self explanatory
-    if aqi <= 50:
-        return 'Good'
-    elif aqi > 50 and aqi <= 100:
-        return 'Satisfactory'
-    elif aqi > 100 and aqi <= 200:
-        return 'Moderate'
-    elif aqi > 200 and aqi <= 300:
-        return 'Poor'
-    elif aqi > 300 and aqi <= 400:
-        return 'Very Poor'
-    else:
-        return 'Severe'
+    return AQI_CLASSES[np.searchsorted(AQI_BOUNDS, aqi, side='left')]
 
 
 #---NOT USED---
 def get_aqi_color(aqi):
-    if aqi <= 50:
-        return '#00E400'
-    elif aqi > 50 and aqi <= 100:
-        return '#FFFF00'
-    elif aqi > 100 and aqi <= 200:
-        return '#FF7E00'
-    elif aqi > 200 and aqi <= 300:
-        return '#FF0000'
-    elif aqi > 300 and aqi <= 400:
-        return '#99004C'
-    else:
-        return '#7E0023'
+    return AQI_COLORS[np.searchsorted(AQI_BOUNDS, aqi, side='left')]
 
 
 #---NOT USED---
 
 
+@timed('apply_class_color')
 def apply_class_color(df, pred=False):
     '''
         Find the class based on the aqi value
@@ -288,10 +628,10 @@ def apply_class_color(df, pred=False):
     if pred is False:
 
         #apply the function to get the aqi class
-        df['aqi_class'] = df['aqi'].apply(get_aqi_class)
+        df['aqi_class'] = classify_aqi(df['aqi'])
         #df['aqi_color'] = df['aqi'].apply(get_aqi_color)
     else:
         #apply the function to get the aqi class
-        df['aqi_class_pred'] = df['aqi_pred'].apply(get_aqi_class)
+        df['aqi_class_pred'] = classify_aqi(df['aqi_pred'])
         #df['aqi_color_pred'] = df['aqi_pred'].apply(get_aqi_color)
     return df
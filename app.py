@@ -1,16 +1,33 @@
 import streamlit as st
-import pandas as pd
-from api_connector import (get_real_time_aqi, get_predicted_aqi,
-                           clean_real_time_aqi, plot_single_data,
-                           clean_prediction_data, plot_multiple_data,
-                           calculate_time_series_error, insert_error_data,
-                           apply_class_color, redirect)
+from aqi_scale import AQI_BREAKPOINTS
+from helpers import redirect
+from env import (cities, profiler, debug, metrics_port, timing_log, offline,
+                 refresh_interval, refresh_jitter, chart_mode)
+from instrumentation import (span, start_trace, current_trace, profile_rerun,
+                             start_metrics_server, start_timing_log)
+from refresher import start_refresher
 import datetime
 
+CHART_MODES = {
+    "Static images": "static",
+    "Interactive (zoom in the browser)": "interactive",
+}
+CHART_MODE_LABELS = {mode: label for label, mode in CHART_MODES.items()}
 
-def main():
+
+def show_clicked(view):
     '''
-        Main function to run the app
+        True once Show was clicked for a view, until another view is shown,
+        so that widgets inside the view (like table pages) keep it open
+    '''
+    if st.button("Show"):
+        st.session_state['shown_view'] = view
+    return st.session_state.get('shown_view') == view
+
+
+def show_page():
+    '''
+        Render the selected page
     '''
 
     #streamlit related configurations
@@ -20,7 +37,6 @@ def main():
         layout="wide",
         initial_sidebar_state="expanded",
     )
-    st.set_option('deprecation.showPyplotGlobalUse', False)
     page_bg_img = """
     <style>
     .stApp {
@@ -46,7 +62,8 @@ def main():
     st.sidebar.title("What to do")
 
     app_mode = st.sidebar.selectbox("Choose the app mode", [
-        "Show Instructions", "AQI Prediction", "About Us", "Read Project Report"
+        "Show Instructions", "AQI Prediction", "City Comparison", "About Us",
+        "Read Project Report"
     ])
 
     #show the instructions
@@ -89,12 +106,13 @@ def main():
         st.write(
             "The AQI scale is divided into six categories, each with a different color. The categories are as follows:"
         )
-        st.write("1. Good: 0-50")
-        st.write("2. Satisfactory: 51-100")
-        st.write("3. Moderate: 101-200")
-        st.write("4. Poor: 201-300")
-        st.write("5. Very Poor: 301-400")
-        st.write("6. Severe: 400+")
+        lower = 0
+        for i, (upper, aqi_class, _) in enumerate(AQI_BREAKPOINTS, start=1):
+            if upper == float('inf'):
+                st.write(f"{i}. {aqi_class}: {lower - 1}+")
+            else:
+                st.write(f"{i}. {aqi_class}: {lower}-{upper}")
+            lower = upper + 1
         st.markdown("---")
         st.subheader("What is the AQI formula?")
         st.write(
@@ -119,6 +137,24 @@ def main():
 
     #show the prediction page
     elif app_mode == "AQI Prediction":
+        #the data stack is only loaded by the pages that use it
+        import pandas as pd
+        from api_connector import (load_aqi_frames, plot_single_data,
+                                   plot_multiple_data, plot_daily_data,
+                                   calculate_city_error, report_error_data,
+                                   get_city_rollups, latest_real_time)
+        from derive import get_derived_frames
+        from table import paged_dataframe
+
+        #the labels are the options, format_func breaks AppTest sessions
+        labels = list(CHART_MODES)
+        label = st.sidebar.radio(
+            "Charts",
+            labels,
+            index=labels.index(CHART_MODE_LABELS.get(chart_mode, labels[0])),
+            key='chart_mode_label')
+        st.session_state['chart_mode'] = CHART_MODES[label]
+
         #set title and subtitle
         st.title("Welcome to PollutionPulse 🌎")
         st.subheader("AQI Prediction (Beta) ")
@@ -156,29 +192,33 @@ def main():
         datetime_start = pd.to_datetime(datetime_start)
         datetime_end = pd.to_datetime(datetime_end) + pd.DateOffset(days=1)
 
-        #Get real time AQI data
-        aqi_data = get_real_time_aqi(city, state)
+        #Get the clean real time and predicted AQI data, from the local
+        #store if it has them, otherwise from the backend
+        df, current_datetime, df_pred = load_aqi_frames(city, state,
+                                                        datetime_start,
+                                                        datetime_end)
 
-        #get predicted AQI data
-        predicted_aqi = get_predicted_aqi(city, state)
-
-        #Clean real time and predicted AQI data
-        df_pred = clean_prediction_data(predicted_aqi)
-        df, current_datetime, _, _ = clean_real_time_aqi(
-            aqi_data, datetime_start, datetime_end)
+        #render whatever arrived if one of the requests failed
+        if df is None and df_pred is None:
+            st.error("Could not reach the backend. Please try again later.")
+            st.stop()
+        elif df is None or df_pred is None:
+            st.warning(
+                "Some of the data could not be fetched. Showing partial results."
+            )
 
         #Calculate model error
-        error, recent_error = calculate_time_series_error(df, df_pred)
-
-        #----FUTUTRE WORK----
-        #insert_error_data(city, state, error)
-        #--------------------
-        st.sidebar.success(f"Total Model Error (MAPE): {error:.2f}")
-        st.sidebar.success(
-            f"Last 24 hours Model Error (MAPE): {recent_error:.2f}")
-        days_ago = (current_datetime - pd.to_datetime('25 Dec 2022')).days
+        if df is not None and df_pred is not None:
+            error, recent_error = calculate_city_error(city, state)
+
+            #sent in the background, the page never waits on it
+            report_error_data(city, state, error)
+            st.sidebar.success(f"Total Model Error (MAPE): {error:.2f}")
+            st.sidebar.success(
+                f"Last 24 hours Model Error (MAPE): {recent_error:.2f}")
         #Write the last updated time
         if df is not None:
+            days_ago = (current_datetime - pd.to_datetime('25 Dec 2022')).days
             st.sidebar.success(f"Last updated {round(days_ago)} days ago.")
             # st.sidebar.markdown("---")
             # if minutes_ago < 60:
@@ -200,40 +240,38 @@ def main():
 
         app_mode_page = st.selectbox("Select an operation", [
             "Show Real Time AQI Data", "Show Predicted AQI Data",
-            "Compare Real Time AQI vs Predicted AQI"
+            "Compare Real Time AQI vs Predicted AQI",
+            "Show Daily and Weekly AQI Statistics"
         ],
                                      index=2)
 
+        #frames derived from the data, built once and shared by the views
+        frames = get_derived_frames(df, df_pred, datetime_start, datetime_end,
+                                    latest_real_time(city, state))
+
         #Plot and show the real time AQI data
-        if app_mode_page == "Show Real Time AQI Data" and st.button("Show"):
+        if app_mode_page == "Show Real Time AQI Data" and show_clicked(
+                app_mode_page):
             st.subheader("Real Time AQI")
             st.write(
                 "This is the real time AQI for your city. (Currently only available for Mumbai, Maharashtra.)"
             )
             if df is not None:
-                df['date_time'] = pd.to_datetime(df['date_time'],
-                                                 format="%d-%m-%Y %H:%M")
-
-                #select the data between the start and end date
-                df = df[(df['date_time'] >= datetime_start) &
-                        (df['date_time'] <= datetime_end)]
-
-                df['date_time'] = df['date_time'].dt.strftime('%d-%m-%Y %H:%M')
                 st.markdown("---")
                 st.subheader("Graph of Real Time AQI")
-                plot_single_data(df, "Real Time AQI")
+                plot_single_data(frames.real, "Real Time AQI")
                 st.markdown("---")
                 st.subheader("Table of AQI")
-                df = apply_class_color(df)
 
                 #make datetime readable
-                st.dataframe(df)
+                paged_dataframe(frames.real, 'real')
             else:
                 st.error("No data found.")
                 st.stop()
 
         #Plot and show the predicted AQI data
-        if app_mode_page == "Show Predicted AQI Data" and st.button("Show"):
+        if app_mode_page == "Show Predicted AQI Data" and show_clicked(
+                app_mode_page):
             st.markdown("---")
             st.subheader("Prediction for next few days")
             st.write(
@@ -242,12 +280,11 @@ def main():
             #if the dataframe is not empty
             if df_pred is not None:
                 st.subheader("AQI Graph")
-                plot_single_data(df_pred, "Predicted AQI")
+                plot_single_data(frames.predicted, "Predicted AQI")
                 st.markdown("---")
                 st.subheader("Table of AQI")
-                df_pred = apply_class_color(df_pred)
                 #add colour to class column
-                st.dataframe(df_pred)
+                paged_dataframe(frames.predicted, 'predicted')
             else:
                 st.error("No data found.")
                 st.stop()
@@ -256,57 +293,83 @@ def main():
             #Plot and show the real time and predicted AQI data
             if df is not None and df_pred is not None:
 
-                df = apply_class_color(df)
-                # convert date_time to datetime object with format 21-11-2022 22:00
-                df['date_time'] = pd.to_datetime(df['date_time'],
-                                                 format="%d-%m-%Y %H:%M")
-
-                #select the data between the start and end date
-                df = df[(df['date_time'] >= datetime_start) &
-                        (df['date_time'] <= datetime_end)]
-
-                df_pred['date_time'] = pd.to_datetime(df_pred['date_time'],
-                                                      format="%d-%m-%Y %H:%M")
-
-                #select the data between the start and end date
-                df_pred = df_pred[df_pred['date_time'] >= datetime_start]
-                df['date_time'] = df['date_time'].dt.strftime('%d-%m-%Y %H:%M')
-                df_pred['date_time'] = df_pred['date_time'].dt.strftime(
-                    '%d-%m-%Y %H:%M')
-                df_pred = df_pred.rename(columns={'aqi': 'aqi_pred'})
-                df_pred = apply_class_color(df_pred, pred=True)
-                df_combined = pd.merge(df, df_pred, on='date_time', how='outer')
-
-                if app_mode_page == "Compare Real Time AQI vs Predicted AQI" and st.button(
-                        "Show"):
+                if app_mode_page == "Compare Real Time AQI vs Predicted AQI" and show_clicked(
+                        app_mode_page):
                     st.markdown("---")
                     st.subheader("Real Time AQI vs Predicted AQI")
                     st.write(
                         "This is the real time AQI vs predicted AQI for your city. (Currently only available for Mumbai, Maharashtra.)"
                     )
                     st.subheader("Graph of Combined AQI")
-                    plot_multiple_data(df_combined)
+                    plot_multiple_data(frames.combined)
                     st.markdown("---")
                     st.subheader("Table of Combined AQI (Common Dates)")
-                    df_combined = pd.merge(df,
-                                           df_pred,
-                                           on='date_time',
-                                           how='inner')
-                    st.dataframe(df_combined)
+                    paged_dataframe(frames.common, 'common')
                     st.markdown("---")
                     st.subheader("Future Prediction (48 hours)")
-                    st.dataframe(df_pred.tail(48))
+                    paged_dataframe(frames.future, 'future')
+                    st.markdown("---")
+                    st.subheader("Model Error by Hour of Day")
+                    st.write(
+                        "MAPE of the predictions for every hour of the day, over the selected dates."
+                    )
+                    paged_dataframe(frames.hour_of_day_errors, 'hour_of_day')
                     st.markdown("---")
                     st.subheader("Past Data")
-                    st.dataframe(df)
+                    paged_dataframe(frames.real, 'past')
                     st.markdown("---")
                     st.subheader("All Predicted Data")
-                    st.dataframe(df_pred)
+                    paged_dataframe(frames.compare_predicted, 'all_predicted')
 
             else:
                 st.error("No data found.")
                 st.stop()
 
+        #Show the daily and weekly rollups of the real time AQI
+        elif app_mode_page == "Show Daily and Weekly AQI Statistics" and show_clicked(
+                app_mode_page):
+            st.markdown("---")
+            st.subheader("Daily and Weekly AQI")
+            st.write(
+                "Mean, 95th percentile and max AQI, hours spent in each AQI class and model error (MAPE) per day and per week."
+            )
+            df_daily, df_weekly = get_city_rollups(city, state)
+            df_daily = df_daily[(df_daily['date'] >= datetime_start) &
+                                (df_daily['date'] < datetime_end)]
+            df_weekly = df_weekly[(df_weekly['week'] +
+                                   pd.DateOffset(days=7) > datetime_start) &
+                                  (df_weekly['week'] < datetime_end)]
+            if not df_daily.empty:
+                st.subheader("Graph of Daily AQI")
+                plot_daily_data(df_daily)
+                st.markdown("---")
+                st.subheader("Table of Daily AQI")
+                paged_dataframe(df_daily.reset_index(drop=True), 'daily')
+                st.markdown("---")
+                st.subheader("Table of Weekly AQI")
+                paged_dataframe(df_weekly.reset_index(drop=True), 'weekly')
+            else:
+                st.error("No data found.")
+                st.stop()
+
+    #show the city comparison page
+    elif app_mode == "City Comparison":
+        from batch import compare_cities
+        from table import paged_dataframe
+
+        st.title("City Comparison")
+        st.warning(
+            "This app has not been updated since 25-Dec-2022 due to high costs. It was made for educational purposes only. The static data is still available for viewing."
+        )
+        st.write(
+            "Cities ranked by their latest real time AQI, cleanest first, with the model error (MAPE) of each city."
+        )
+        ranking = compare_cities(cities)
+        if ranking.empty:
+            st.error("No data found.")
+            st.stop()
+        paged_dataframe(ranking, 'ranking')
+
     #show the about us page
     elif app_mode == "About Us":
         st.title("About Us")
@@ -354,5 +417,45 @@ def main():
         )
 
 
+def show_debug_panel(profile):
+    '''
+        Show the timings (and profile) of this rerun in the sidebar
+    '''
+    with st.sidebar.expander("Debug: rerun timings"):
+        spans = current_trace()
+        if spans:
+            st.dataframe(spans)
+        if profile.get('report'):
+            st.text(profile['report'])
+    with st.sidebar.expander("Debug: memory per city"):
+        #imported here, it pulls in the data stack
+        from api_connector import memory_footprint
+        footprint = memory_footprint()
+        if footprint:
+            st.dataframe(footprint)
+        else:
+            st.write("No series loaded yet.")
+
+
+def main():
+    '''
+        Main function to run the app
+    '''
+    if metrics_port:
+        start_metrics_server(metrics_port)
+    if timing_log:
+        start_timing_log(timing_log)
+    if refresh_interval and not offline:
+        start_refresher(cities, refresh_interval, refresh_jitter)
+    start_trace()
+    profile = {}
+    try:
+        with profile_rerun(profiler) as profile, span('rerun'):
+            show_page()
+    finally:
+        if debug:
+            show_debug_panel(profile)
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,12 @@
+#upper bound (inclusive), class and color of every AQI category
+#kept free of third party imports, the instructions page only needs this
+AQI_BREAKPOINTS = [
+    (50, 'Good', '#00E400'),
+    (100, 'Satisfactory', '#FFFF00'),
+    (200, 'Moderate', '#FF7E00'),
+    (300, 'Poor', '#FF0000'),
+    (400, 'Very Poor', '#99004C'),
+    (float('inf'), 'Severe', '#7E0023'),
+]
+AQI_CLASSES = [aqi_class for _, aqi_class, _ in AQI_BREAKPOINTS]
+AQI_COLORS = [color for _, _, color in AQI_BREAKPOINTS]
@@ -0,0 +1,162 @@
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+
+import numpy as np
+import pandas as pd
+
+from api_connector import (get_real_time_aqi, get_predicted_aqi,
+                           load_city_series, clean_real_time_frame,
+                           clean_prediction_frame, classify_aqi)
+from cache import TTLCache
+from env import batch_concurrency, cache_ttl, cache_max_entries, offline
+from history import BACKEND_FORMAT
+from instrumentation import submit_traced
+from series import AQISeries
+
+KEYS = ['city', 'state']
+
+#bounded, so a long list of cities does not open hundreds of connections
+batch_pool = ThreadPoolExecutor(max_workers=batch_concurrency,
+                                thread_name_prefix='aqi-batch')
+
+#rankings, keyed by the identity of the series and payloads they were built
+#from
+comparison_cache = TTLCache(cache_ttl, cache_max_entries)
+
+
+def _fetch_city(city, state):
+    return get_real_time_aqi(city, state), get_predicted_aqi(city, state)
+
+
+def fetch_many(pairs):
+    '''
+        Fetch the real time and predicted AQI of many (city, state) pairs.
+        Returns two dicts keyed by the pair, failed fetches are None.
+    '''
+    futures = {
+        pair: submit_traced(batch_pool, _fetch_city, *pair) for pair in pairs
+    }
+    real, pred = {}, {}
+    for pair, future in futures.items():
+        try:
+            real[pair], pred[pair] = future.result()
+        except Exception:
+            real[pair], pred[pair] = None, None
+    return real, pred
+
+
+def parse_long_frame(payloads, value_key):
+    '''
+        Parse the payloads of many cities into one long format dataframe
+        with city, state, date_time and aqi columns
+    '''
+    pairs = [(pair, payload['data'])
+             for pair, payload in payloads.items()
+             if payload is not None and payload['data']]
+    df = pd.DataFrame.from_records(list(
+        chain.from_iterable(rows for _, rows in pairs)),
+                                   columns=['datetime', value_key])
+    df.columns = ['date_time', 'aqi']
+    df['date_time'] = pd.to_datetime(df['date_time'], format=BACKEND_FORMAT)
+    df['aqi'] = pd.to_numeric(df['aqi'])
+
+    #city and state of every row, without building a string per row
+    counts = [len(rows) for _, rows in pairs]
+    for position, key in enumerate(KEYS):
+        codes, categories = pd.factorize([pair[position] for pair, _ in pairs])
+        df[key] = pd.Categorical.from_codes(np.repeat(codes, counts),
+                                            categories=categories)
+    return df
+
+
+def score_cities(df_real, df_pred):
+    '''
+        MAPE of every city, hours with a real AQI of 0 are left out
+    '''
+    df_combined = pd.merge(df_real,
+                           df_pred.rename(columns={'aqi': 'aqi_pred'}),
+                           on=[*KEYS, 'date_time'],
+                           how='inner')
+    df_combined = df_combined[df_combined['aqi'] != 0]
+    error = ((df_combined['aqi'] - df_combined['aqi_pred']).abs() /
+             df_combined['aqi'] * 100)
+    return error.groupby([df_combined[key] for key in KEYS],
+                         observed=True).mean().rename('mape')
+
+
+def load_cities(pairs):
+    '''
+        Real time and predicted data of many cities: the background
+        refreshed or stored series when there are some, the backend payloads
+        otherwise (never in offline mode). Returns a dict of (real, predicted)
+        keyed by the pair, sides without data are None.
+    '''
+    sources = {pair: list(load_city_series(*pair)) for pair in pairs}
+    missing = [pair for pair, sides in sources.items() if None in sides]
+    if missing and not offline:
+        real, pred = fetch_many(missing)
+        for pair in missing:
+            sides = sources[pair]
+            if sides[0] is None:
+                sides[0] = real[pair]
+            if sides[1] is None:
+                sides[1] = pred[pair]
+    return {pair: tuple(sides) for pair, sides in sources.items()}
+
+
+def city_frame(sources, side, value_key, clean):
+    '''
+        Long format dataframe of one side of many cities, with city, state,
+        date_time and aqi columns. Series are used as they are, payloads are
+        parsed and cleaned.
+    '''
+    payloads = {
+        pair: sides[side]
+        for pair, sides in sources.items()
+        if sides[side] is not None and not isinstance(sides[side], AQISeries)
+    }
+    frames = [clean(parse_long_frame(payloads, value_key), KEYS)]
+    for pair, sides in sources.items():
+        if isinstance(sides[side], AQISeries):
+            df = sides[side].to_frame()
+            df['city'], df['state'] = pair
+            frames.append(df)
+    df = pd.concat(frames, ignore_index=True)
+    for key in KEYS:
+        df[key] = df[key].astype('category')
+    return df
+
+
+def compare_cities(pairs):
+    '''
+        Load, clean, classify and score many cities together and rank them
+        by their latest AQI, cleanest first. The ranking is only built again
+        when a series or payload changed, it must not be modified.
+    '''
+    sources = load_cities(pairs)
+    #the sources are kept with the ranking so their ids are not reused
+    key = tuple(
+        (pair, id(real), id(pred)) for pair, (real, pred) in sources.items())
+    return comparison_cache.get_or_load(
+        key, lambda: (sources, _rank_cities(sources)))[1]
+
+
+def _rank_cities(sources):
+    '''
+        Ranking of the cities of some loaded series and payloads
+    '''
+    df_real = city_frame(sources, 0, 'aqi', clean_real_time_frame)
+    df_pred = city_frame(sources, 1, 'yhat', clean_prediction_frame)
+
+    df_real = df_real.sort_values('date_time', kind='stable')
+    summary = df_real.groupby(KEYS, observed=True).agg(
+        latest_aqi=('aqi', 'last'),
+        last_updated=('date_time', 'last'),
+        mean_aqi=('aqi', 'mean'),
+        max_aqi=('aqi', 'max'),
+    )
+    summary['aqi_class'] = classify_aqi(summary['latest_aqi'])
+    summary = summary.join(score_cities(df_real, df_pred))
+    summary = summary.sort_values('latest_aqi').reset_index()
+    summary.insert(0, 'rank', np.arange(1, len(summary) + 1))
+    return summary
@@ -0,0 +1,101 @@
+'''
+    End to end rerun latency of the app against the local fake backend,
+    driven headlessly by Streamlit's AppTest (streamlit 1.28 or newer, see
+    requirements-dev.txt).
+    Run with: python bench_app.py [--rows 1000] [--reruns 20]
+'''
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+from fake_backend import FakeBackend
+
+FLOWS = [
+    "Show Real Time AQI Data", "Show Predicted AQI Data",
+    "Compare Real Time AQI vs Predicted AQI"
+]
+
+
+def point_app_at(server):
+    '''
+        Make the app use the fake backend and an empty local store.
+        Must run before the app modules are imported.
+    '''
+    os.environ['url'] = server.url
+    os.environ['store_dir'] = tempfile.mkdtemp(prefix='aqi-store-')
+
+
+def open_prediction_page():
+    '''
+        Start a headless session of the app on the AQI Prediction page
+    '''
+    #optional, the app itself runs on older streamlit versions
+    try:
+        from streamlit.testing.v1 import AppTest
+    except ImportError:
+        raise SystemExit("AppTest needs streamlit 1.28 or newer, install "
+                         "requirements-dev.txt in a separate environment")
+
+    at = AppTest.from_file('app.py', default_timeout=60)
+    at.run()
+    at.sidebar.selectbox[0].select("AQI Prediction").run()
+    return at
+
+
+def run_flow(at, flow):
+    '''
+        Select an operation and click Show, return the rerun time in seconds
+    '''
+    operation = [
+        selectbox for selectbox in at.selectbox
+        if selectbox.label == "Select an operation"
+    ][0]
+    operation.select(flow).run()
+    start = time.perf_counter()
+    at.button[0].click().run()
+    elapsed = time.perf_counter() - start
+    if at.exception:
+        raise RuntimeError(f"{flow} failed: {at.exception[0].message}")
+    return elapsed
+
+
+def percentile(values, percent):
+    '''
+        Nearest rank percentile of a list of values
+    '''
+    ordered = sorted(values)
+    rank = max(0,
+               min(len(ordered) - 1,
+                   round(percent / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=1000)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--reruns', type=int, default=20)
+    args = parser.parse_args()
+
+    server = FakeBackend(rows=args.rows, latency=args.latency).start()
+    point_app_at(server)
+
+    start = time.perf_counter()
+    at = open_prediction_page()
+    print(f"first load of the AQI Prediction page: "
+          f"{time.perf_counter() - start:.3f} s")
+
+    print(f"{'flow':<40} {'p50 (s)':>8} {'p95 (s)':>8} {'mean (s)':>9}")
+    for flow in FLOWS:
+        timings = [run_flow(at, flow) for _ in range(args.reruns)]
+        print(f"{flow:<40} {percentile(timings, 50):>8.3f} "
+              f"{percentile(timings, 95):>8.3f} "
+              f"{statistics.mean(timings):>9.3f}")
+    print(f"backend requests: {server.requests}")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
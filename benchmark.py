@@ -0,0 +1,226 @@
+'''
+    Benchmarks for the data pipeline of the app.
+    Run with: python benchmark.py [--sizes 10000 100000 1000000] [--only ...]
+    End to end rerun latency of the app is measured by bench_app.py
+'''
+import argparse
+import datetime
+import io
+import random
+import time
+
+import numpy as np
+import pandas as pd
+
+from decimate import decimate_series, decimation_cache
+from fake_backend import FakeBackend
+from http_client import BackendClient
+from api_connector import (clean_real_time_aqi, clean_prediction_data,
+                           format_for_display, classify_aqi, apply_class_color,
+                           calculate_time_series_error)
+
+
+def make_payload(rows, value_key='aqi', start='21/11/2022 00:00:00'):
+    '''
+        Build a synthetic backend payload with hourly rows
+    '''
+    start = datetime.datetime.strptime(start, '%d/%m/%Y %H:%M:%S')
+    step = datetime.timedelta(hours=1)
+    return {
+        'data': [{
+            'datetime': (start + i * step).strftime('%d/%m/%Y %H:%M:%S'),
+            value_key: random.uniform(0, 500)
+        } for i in range(rows)]
+    }
+
+
+def timeit(function, *args, repeat=3):
+    '''
+        Return the best wall time of a few runs in seconds
+    '''
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+#---REFERENCE IMPLEMENTATIONS---
+#the row by row, string based cleaning functions the vectorized pipeline
+#replaced, kept to compare speed, test_cleaning.py compares the output
+def legacy_clean_real_time_aqi(aqi_data):
+    aqi = []
+    date_time = []
+    for data in aqi_data['data']:
+        aqi.append(data['aqi'])
+        date_time.append(data['datetime'])
+    df = pd.DataFrame(list(zip(date_time, aqi)), columns=['date_time', 'aqi'])
+    df['date_time'] = pd.to_datetime(df['date_time'],
+                                     format='%d/%m/%Y %H:%M:%S')
+    df['date_time'] = df['date_time'].dt.strftime('%d-%m-%Y %H:%M')
+    df['date_time'] = df['date_time'].apply(lambda x: x[:-2] + '00')
+    return df.drop_duplicates(subset=['date_time'], keep='last')
+
+
+def legacy_clean_prediction_data(aqi_data):
+    date_time = []
+    aqi = []
+    for data in aqi_data['data']:
+        date_time.append(
+            pd.to_datetime(data['datetime'], format='%d/%m/%Y %H:%M:%S'))
+        aqi.append(data['yhat'])
+    df = pd.DataFrame(list(zip(date_time, aqi)), columns=['date_time', 'aqi'])
+    df['date_time'] = df['date_time'].dt.strftime('%d-%m-%Y %H:%M')
+    df_greater_9_dec_2022 = df[df['date_time'] >= '09-12-2022 00:00']
+    df_greater_9_dec_2022 = df_greater_9_dec_2022[
+        df_greater_9_dec_2022['date_time'].apply(lambda x: x[-2:]) == '00']
+    df = pd.concat(
+        [df[df['date_time'] < '09-12-2022 00:00'], df_greater_9_dec_2022])
+    df['date_time'] = df['date_time'].apply(lambda x: x[:-2] + '00')
+    return df.drop_duplicates(subset=['date_time'],
+                              keep='last').reset_index(drop=True)
+
+
+def legacy_get_aqi_class(aqi):
+    if aqi <= 50:
+        return 'Good'
+    elif aqi > 50 and aqi <= 100:
+        return 'Satisfactory'
+    elif aqi > 100 and aqi <= 200:
+        return 'Moderate'
+    elif aqi > 200 and aqi <= 300:
+        return 'Poor'
+    elif aqi > 300 and aqi <= 400:
+        return 'Very Poor'
+    else:
+        return 'Severe'
+
+
+#---REFERENCE IMPLEMENTATIONS---
+
+
+def bench_parsing(sizes):
+    '''
+        Compare the row by row cleaning with the vectorized pipeline
+    '''
+    print('parsing')
+    print(f"{'rows':>10} {'stage':<24} {'legacy (s)':>12} {'current (s)':>12}")
+    for rows in sizes:
+        real = make_payload(rows, 'aqi')
+        pred = make_payload(rows, 'yhat')
+        #the per row to_datetime of the old prediction cleaning is very slow,
+        #do not run it more than once on big payloads
+        repeat = 3 if rows <= 100000 else 1
+        print(
+            f"{rows:>10} {'clean_real_time_aqi':<24} "
+            f"{timeit(legacy_clean_real_time_aqi, real, repeat=repeat):>12.3f} "
+            f"{timeit(clean_real_time_aqi, real, None, None, repeat=repeat):>12.3f}"
+        )
+        print(
+            f"{rows:>10} {'clean_prediction_data':<24} "
+            f"{timeit(legacy_clean_prediction_data, pred, repeat=repeat):>12.3f} "
+            f"{timeit(clean_prediction_data, pred, repeat=repeat):>12.3f}")
+
+
+def bench_classification(sizes):
+    '''
+        Compare the row wise class lookup with the breakpoint table
+    '''
+    print('classification')
+    print(f"{'rows':>10} {'legacy (s)':>12} {'current (s)':>12}")
+    for rows in sizes:
+        aqi = pd.Series(np.random.uniform(0, 500, rows))
+        print(f"{rows:>10} "
+              f"{timeit(aqi.apply, legacy_get_aqi_class):>12.3f} "
+              f"{timeit(classify_aqi, aqi):>12.3f}")
+
+
+def render_png(x, y):
+    '''
+        Render a line plot to PNG like the app does, return the image size
+    '''
+    from matplotlib.figure import Figure
+    figure = Figure()
+    axes = figure.subplots()
+    axes.plot(x, y)
+    buffer = io.BytesIO()
+    figure.savefig(buffer, format='png')
+    return buffer.tell()
+
+
+def bench_plotting(sizes, width=1000):
+    '''
+        Compare rendering every point with rendering the decimated series
+    '''
+    print('plotting')
+    print(f"{'rows':>10} {'full (s)':>10} {'full (kB)':>10} "
+          f"{'decimated (s)':>14} {'decimated (kB)':>15}")
+    for rows in sizes:
+        x = pd.date_range('2022-11-21', periods=rows, freq='H').to_numpy()
+        y = np.random.uniform(0, 500, rows)
+        full_time = timeit(render_png, x, y, repeat=1)
+        full_size = render_png(x, y)
+
+        def decimated():
+            decimation_cache.invalidate()
+            return render_png(*decimate_series(x, y, width))
+
+        decimated_time = timeit(decimated, repeat=1)
+        decimated_size = decimated()
+        print(f"{rows:>10} {full_time:>10.3f} {full_size / 1024:>10.1f} "
+              f"{decimated_time:>14.3f} {decimated_size / 1024:>15.1f}")
+
+
+def bench_pipeline(sizes, latency=0.0):
+    '''
+        Time every stage of the AQI Prediction page against the local
+        fake backend
+    '''
+    print('pipeline')
+    stages = ['fetch', 'clean real', 'clean pred', 'error', 'classify']
+    print(f"{'rows':>10} " +
+          ' '.join(f"{stage + ' (s)':>14}" for stage in stages))
+    for rows in sizes:
+        server = FakeBackend(rows=rows, latency=latency).start()
+        client = BackendClient(server.url)
+        params = {'city': 'Mumbai', 'state': 'Maharashtra'}
+        real = client.get_json('/retrieve', params)
+        pred = client.get_json('/retrieve_all', params)
+        df, _, _, _ = clean_real_time_aqi(real, None, None)
+        df_pred = clean_prediction_data(pred)
+
+        timings = [
+            timeit(client.get_json, '/retrieve', params),
+            timeit(clean_real_time_aqi, real, None, None),
+            timeit(clean_prediction_data, pred),
+            timeit(calculate_time_series_error, df, df_pred),
+            timeit(apply_class_color, df.copy()),
+        ]
+        print(f"{rows:>10} " +
+              ' '.join(f"{timing:>14.3f}" for timing in timings))
+        server.shutdown()
+        server.server_close()
+
+
+def main():
+    benches = {
+        'parsing': bench_parsing,
+        'classification': bench_classification,
+        'plotting': bench_plotting,
+        'pipeline': bench_pipeline,
+    }
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes',
+                        nargs='+',
+                        type=int,
+                        default=[10000, 100000, 1000000])
+    parser.add_argument('--only', nargs='+', choices=list(benches))
+    args = parser.parse_args()
+    for name, bench in benches.items():
+        if not args.only or name in args.only:
+            bench(args.sizes)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+def content_hash(*arrays):
+    '''
+        Hash the content of some arrays, to use as part of a cache key
+    '''
+    digest = hashlib.blake2b(digest_size=16)
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        digest.update(str(array.dtype).encode())
+        digest.update(array.tobytes())
+    return digest.hexdigest()
+
+
+class _InFlight:
+    '''
+        A load that is currently running for a key
+    '''
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class TTLCache:
+    '''
+        Process-wide cache with a time to live, LRU eviction and
+        single-flight loading
+    '''
+
+    def __init__(self, ttl, max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def get_or_load(self, key, loader):
+        '''
+            Return the cached value for key, calling loader on a miss.
+            Concurrent misses for the same key share a single loader call.
+        '''
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    #mark as recently used
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+
+            call = self._inflight.get(key)
+            if call is not None:
+                #somebody else is already loading this key, wait for them
+                self.coalesced += 1
+                leader = False
+            else:
+                call = _InFlight()
+                self._inflight[key] = call
+                self.misses += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value
+
+        try:
+            call.value = loader()
+        except Exception as error:
+            call.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+                #failed loads (None) are not cached so the next rerun retries
+                if call.error is None and call.value is not None:
+                    self._set(key, call.value)
+            call.done.set()
+        return call.value
+
+    def _set(self, key, value):
+        '''
+            Store a value, evicting the least recently used entries if full
+        '''
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key=None):
+        '''
+            Drop one key, or every key if none is given
+        '''
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def stats(self):
+        '''
+            Return the hit/miss counters of the cache
+        '''
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'evictions': self.evictions,
+                'size': len(self._entries),
+            }
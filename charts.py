@@ -0,0 +1,85 @@
+'''
+    Interactive line charts drawn by the browser with Vega-Lite. The series
+    are sent once, as Arrow, and zooming or selecting a range happens on the
+    client without a rerun.
+'''
+import numpy as np
+import pandas as pd
+
+
+def chart_frame(x, lines):
+    '''
+        Long format frame of one or more lines sharing the same x values,
+        with float32 values and a categorical series name
+    '''
+    x = np.asarray(x)
+    frames = []
+    for y, label in lines:
+        y = np.asarray(y, dtype=np.float32)
+        keep = ~np.isnan(y)
+        frames.append(
+            pd.DataFrame({
+                'date_time': x[keep],
+                'aqi': y[keep],
+                'series': label or 'AQI',
+            }))
+    df = pd.concat(frames, ignore_index=True)
+    df['series'] = df['series'].astype('category')
+    return df
+
+
+def line_chart_spec(title, xlabel):
+    '''
+        Vega-Lite spec of a detail chart over an overview chart, brushing a
+        range on the overview zooms the detail to it
+    '''
+    #the times are naive UTC, show them in UTC so they match the tables
+    #instead of shifting them to the timezone of the browser
+    time = {'field': 'date_time', 'type': 'temporal'}
+    x = {**time, 'scale': {'type': 'utc'}}
+    time_tooltip = {**time, 'format': '%d %b %Y %H:%M', 'formatType': 'utc'}
+    y = {'field': 'aqi', 'type': 'quantitative', 'title': 'AQI'}
+    color = {'field': 'series', 'type': 'nominal', 'title': None}
+    return {
+        'title':
+            title,
+        'vconcat': [{
+            'mark': 'line',
+            'height': 300,
+            'encoding': {
+                'x': {
+                    **x, 'title': None,
+                    'scale': {
+                        'type': 'utc',
+                        'domain': {
+                            'param': 'brush'
+                        }
+                    }
+                },
+                'y': y,
+                'color': color,
+                'tooltip': [time_tooltip, y, color],
+            },
+        }, {
+            'mark': 'line',
+            'height': 60,
+            'params': [{
+                'name': 'brush',
+                'select': {
+                    'type': 'interval',
+                    'encodings': ['x']
+                }
+            }],
+            'encoding': {
+                'x': {
+                    **x, 'title': xlabel
+                },
+                'y': {
+                    **y, 'axis': {
+                        'tickCount': 3
+                    }
+                },
+                'color': color,
+            },
+        }],
+    }
@@ -0,0 +1,70 @@
+'''
+    Measure the cold import of app with python -X importtime and fail if it
+    goes over the startup budget or pulls in modules only some pages need.
+    Run with: python check_startup.py [--budget-ms 3000]
+'''
+import argparse
+import os
+import subprocess
+import sys
+
+#loaded lazily by the pages that use them, never at startup. requests and
+#pandas are not listed because streamlit itself imports them.
+LAZY_MODULES = [
+    'matplotlib', 'api_connector', 'http_client', 'render', 'batch', 'derive',
+    'store', 'series', 'rollup', 'charts'
+]
+
+
+def import_times():
+    '''
+        Cold import app in a fresh interpreter and return the cumulative
+        import time of every module in microseconds
+    '''
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import app'],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True,
+        check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--budget-ms',
+                        type=float,
+                        default=float(os.environ.get('startup_budget_ms',
+                                                     3000)))
+    args = parser.parse_args()
+
+    times = import_times()
+    total_ms = times['app'] / 1000
+    print(f"cold import of app: {total_ms:.0f} ms "
+          f"(budget {args.budget_ms:.0f} ms)")
+    top_level = sorted(((us, name)
+                        for name, us in times.items()
+                        if '.' not in name and name != 'app'),
+                       reverse=True)[:10]
+    for us, name in top_level:
+        print(f"  {us / 1000:8.1f} ms  {name}")
+
+    failures = []
+    if total_ms > args.budget_ms:
+        failures.append(f"startup took {total_ms:.0f} ms, over the budget")
+    for module in LAZY_MODULES:
+        if module in times:
+            failures.append(f"{module} is imported at startup")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+import numpy as np
+
+from cache import TTLCache, content_hash
+from env import cache_ttl, cache_max_entries
+
+#decimated series, keyed by (series, range, width)
+decimation_cache = TTLCache(cache_ttl, cache_max_entries)
+
+
+def lttb(x, y, threshold):
+    '''
+        Largest-Triangle-Three-Buckets downsampling of a series.
+        Returns the indices of the points to keep.
+    '''
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype='float64')
+    y = np.asarray(y, dtype='float64')
+    #the first and last point are always kept, the rest is split in buckets
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    keep = np.empty(threshold, dtype=np.int64)
+    keep[0] = 0
+    keep[-1] = n - 1
+
+    previous = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        #average of the next bucket (the last point for the last bucket)
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        next_start = end if i + 2 < len(edges) else n - 1
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+
+        #pick the point that makes the largest triangle with the previous
+        #point and the average of the next bucket
+        area = np.abs((x[previous] - avg_x) * (y[start:end] - y[previous]) -
+                      (x[previous] - x[start:end]) * (avg_y - y[previous]))
+        previous = start + int(np.argmax(area))
+        keep[i + 1] = previous
+    return keep
+
+
+def minmax(y, buckets):
+    '''
+        Keep the minimum and maximum of every bucket of a series.
+        Returns the indices of the points to keep.
+    '''
+    n = len(y)
+    if 2 * buckets >= n:
+        return np.arange(n)
+
+    y = np.asarray(y, dtype='float64')
+    edges = np.linspace(0, n, buckets + 1).astype(np.int64)
+    lows = np.minimum.reduceat(y, edges[:-1])
+    highs = np.maximum.reduceat(y, edges[:-1])
+    keep = []
+    for start, end, low, high in zip(edges[:-1], edges[1:], lows, highs):
+        window = y[start:end]
+        keep.append(start + int(np.argmax(window == low)))
+        keep.append(start + int(np.argmax(window == high)))
+    return np.unique(keep)
+
+
+def decimate_series(x, y, width, method='lttb'):
+    '''
+        Downsample a series to about width points, skipping missing values.
+        Results are cached by the content of the series, its range and the
+        width.
+    '''
+    x = np.asarray(x)
+    y = np.asarray(y, dtype='float64')
+    present = ~np.isnan(y)
+    x, y = x[present], y[present]
+    if len(x) <= width:
+        return x, y
+
+    key = (content_hash(x, y), x[0], x[-1], width, method)
+
+    def load():
+        x_numeric = x.astype('int64') if x.dtype.kind == 'M' else x
+        if method == 'minmax':
+            keep = minmax(y, width // 2)
+        else:
+            keep = lttb(x_numeric, y, width)
+        return x[keep], y[keep]
+
+    return decimation_cache.get_or_load(key, load)
@@ -0,0 +1,128 @@
+from functools import cached_property
+
+import streamlit as st
+
+from api_connector import apply_class_color
+from instrumentation import span
+from series import AlignedSeries
+
+
+def _with_class(df, pred=False):
+    '''
+        The frame with its aqi class column, classified only when the
+        frame does not carry its class already
+    '''
+    column = 'aqi_class_pred' if pred else 'aqi_class'
+    if column in df.columns:
+        return df
+    return apply_class_color(df.copy(), pred=pred)
+
+
+class DerivedFrames:
+    '''
+        Frames the AQI Prediction views derive from the cleaned real time
+        and predicted AQI of one date range. Each one is computed on first
+        use and then shared between the views, so they must not be modified.
+    '''
+
+    def __init__(self, df, df_pred, datetime_start, latest_real=None):
+        self._df = df
+        self._df_pred = df_pred
+        self._datetime_start = datetime_start
+        #newest real time AQI of all the data, not only of the date range
+        self._latest_real = latest_real
+
+    @cached_property
+    def real(self):
+        '''
+            Real time AQI of the date range with its class
+        '''
+        return _with_class(self._df)
+
+    @cached_property
+    def predicted(self):
+        '''
+            All the predicted AQI with its class
+        '''
+        return _with_class(self._df_pred)
+
+    @cached_property
+    def compare_predicted(self):
+        '''
+            Predicted AQI from the start date on, with aqi_pred columns
+        '''
+        df_pred = self._df_pred[self._df_pred['date_time'] >=
+                                self._datetime_start]
+        df_pred = df_pred.rename(columns={
+            'aqi': 'aqi_pred',
+            'aqi_class': 'aqi_class_pred'
+        })
+        return _with_class(df_pred, pred=True)
+
+    @cached_property
+    def aligned(self):
+        '''
+            Real and predicted AQI on one hourly axis
+        '''
+        with span('align'):
+            return AlignedSeries.from_frames(self._df, self._df_pred)
+
+    def _compare_frame(self, series, how):
+        #same columns as the real frame merged with compare_predicted
+        df = apply_class_color(series.to_frame(how))
+        df = apply_class_color(df, pred=True)
+        return df[[
+            'date_time', 'aqi', 'aqi_class', 'aqi_pred', 'aqi_class_pred'
+        ]]
+
+    @cached_property
+    def combined(self):
+        '''
+            Real and predicted AQI on every date of either
+        '''
+        return self._compare_frame(self.aligned.slice(self._datetime_start),
+                                   'outer')
+
+    @cached_property
+    def common(self):
+        '''
+            Real and predicted AQI on the dates they share
+        '''
+        return self._compare_frame(self.aligned.slice(self._datetime_start),
+                                   'inner')
+
+    @cached_property
+    def future(self):
+        '''
+            Predicted AQI of the 48 hours after the newest real time AQI
+        '''
+        return apply_class_color(self.aligned.horizon(
+            48, self._latest_real).to_frame('predicted'),
+                                 pred=True)
+
+    @cached_property
+    def hour_of_day_errors(self):
+        '''
+            Model error for every hour of the day
+        '''
+        return self.aligned.hour_of_day_errors()
+
+
+def get_derived_frames(df,
+                       df_pred,
+                       datetime_start,
+                       datetime_end,
+                       latest_real=None):
+    '''
+        Get the derived frames of this session for the given data and date
+        range, building them only when either changed. load_aqi_frames
+        hands out the same frame objects until the data changes, so the
+        frames are keyed by identity. The cached DerivedFrames holds them,
+        which keeps their ids from being reused.
+    '''
+    key = (id(df), id(df_pred), datetime_start, datetime_end, latest_real)
+    cached = st.session_state.get('derived_frames')
+    if cached is None or cached[0] != key:
+        cached = (key, DerivedFrames(df, df_pred, datetime_start, latest_real))
+        st.session_state['derived_frames'] = cached
+    return cached[1]
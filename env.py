@@ -3,4 +3,77 @@ import os
 #Environment variables
 url = os.environ.get('url', "https://aqi-backend-msml.herokuapp.com/")
 city = os.environ.get('city', "Mumbai")
-state = os.environ.get('state', "Maharashtra")
\ No newline at end of file
+state = os.environ.get('state', "Maharashtra")
+
+#Response cache settings
+cache_ttl = float(os.environ.get('cache_ttl', 300))
+cache_max_entries = int(os.environ.get('cache_max_entries', 64))
+
+#Backend client settings
+pool_size = int(os.environ.get('pool_size', 10))
+connect_timeout = float(os.environ.get('connect_timeout', 3.05))
+read_timeout = float(os.environ.get('read_timeout', 15))
+retrieve_all_read_timeout = float(
+    os.environ.get('retrieve_all_read_timeout', 30))
+max_retries = int(os.environ.get('max_retries', 2))
+retry_budget_ratio = float(os.environ.get('retry_budget_ratio', 0.1))
+breaker_failures = int(os.environ.get('breaker_failures', 5))
+breaker_reset = float(os.environ.get('breaker_reset', 30))
+
+#Overall deadline for fetching the data of one page
+fetch_deadline = float(os.environ.get('fetch_deadline', 20))
+
+#Local store of the cleaned series, offline=1 never contacts the backend
+store_dir = os.environ.get('store_dir', "data")
+offline = os.environ.get('offline', "0") == "1"
+
+#Background refresh of the configured cities every refresh_interval
+#seconds plus up to refresh_jitter seconds, 0 turns it off
+refresh_interval = float(os.environ.get('refresh_interval', 0))
+refresh_jitter = float(os.environ.get('refresh_jitter', 30))
+
+#Maximum number of points drawn per line in a plot
+plot_points = int(os.environ.get('plot_points', 1000))
+
+#Default chart mode, "static" images or "interactive" browser charts
+chart_mode = os.environ.get('chart_mode', "static")
+
+
+#Cities on the comparison page as "city:state" pairs separated by commas
+def _parse_cities(value):
+    '''
+        Parse "city:state" pairs, a bad pair is a configuration error
+    '''
+    pairs = []
+    for entry in value.split(','):
+        if not entry.strip():
+            continue
+        fields = [field.strip() for field in entry.split(':')]
+        if len(fields) != 2 or not all(fields):
+            raise ValueError(
+                f"cities: expected city:state, got {entry.strip()!r}")
+        pairs.append(tuple(fields))
+    return pairs
+
+
+cities = _parse_cities(os.environ.get('cities', f"{city}:{state}"))
+batch_concurrency = int(os.environ.get('batch_concurrency', 8))
+
+#Instrumentation: profiler is "cprofile" or "pyinstrument", debug=1 shows
+#the timings of every rerun in the sidebar, metrics_port serves /metrics,
+#timing_log writes every span as a JSON line to "stderr" or to a file path
+profiler = os.environ.get('profiler', "")
+debug = os.environ.get('debug', "0") == "1"
+metrics_port = int(os.environ.get('metrics_port', 0))
+timing_log = os.environ.get('timing_log', "")
+
+#Background error reporting
+error_queue_size = int(os.environ.get('error_queue_size', 1000))
+error_batch_size = int(os.environ.get('error_batch_size', 20))
+error_flush_interval = float(os.environ.get('error_flush_interval', 60))
+error_spill_path = os.environ.get('error_spill_path',
+                                  os.path.join(store_dir, "errors.jsonl"))
+
+#Rows per page of the tables, and the most a single page may send
+table_page_size = int(os.environ.get('table_page_size', 50))
+table_max_rows = int(os.environ.get('table_max_rows', 500))
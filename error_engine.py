@@ -0,0 +1,159 @@
+import bisect
+import datetime
+import threading
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_WINDOWS = {
+    '24h': datetime.timedelta(hours=24),
+    '7d': datetime.timedelta(days=7),
+}
+
+
+class ErrorAccumulator:
+    '''
+        Running MAPE between real and predicted AQI, keyed by hour.
+        Only rows newer than the ones already seen are processed, so each
+        update costs O(new rows) in Python.
+    '''
+
+    def __init__(self, windows=None):
+        self.windows = dict(windows or DEFAULT_WINDOWS)
+        #hours seen on only one side, waiting for the other one
+        self._real = {}
+        self._pred = {}
+        self._real_until = None
+        self._pred_until = None
+        self.total = 0.0
+        self.count = 0
+        self.zero_aqi_hours = 0
+        self.latest = None
+        self._entries = {name: deque() for name in self.windows}
+        self._sums = {name: 0.0 for name in self.windows}
+        #(sum, count) of the errors of every day, for the rollups
+        self._days = {}
+        self._lock = threading.Lock()
+
+    def update(self, df_real, df_pred):
+        '''
+            Add the rows of the cleaned real and predicted dataframes that
+            arrived since the last update
+        '''
+        with self._lock:
+            if df_real is not None:
+                self._real_until = self._add(df_real, self._real_until,
+                                             self._real, self._pred, True)
+            if df_pred is not None:
+                self._pred_until = self._add(df_pred, self._pred_until,
+                                             self._pred, self._real, False)
+
+    def _add(self, df, until, own, other, is_real):
+        '''
+            Match new rows of one side against the pending rows of the
+            other side, return the new high-water mark
+        '''
+        if until is not None:
+            df = df[df['date_time'] > until]
+        if df.empty:
+            return until
+
+        hours = df['date_time'].to_numpy()
+        values = df['aqi'].to_numpy(dtype='float64')
+        for hour, value in zip(hours, values):
+            if hour in other:
+                match = other.pop(hour)
+                if is_real:
+                    self._record(hour, value, match)
+                else:
+                    self._record(hour, match, value)
+            else:
+                own[hour] = value
+        newest = hours.max()
+        return newest if until is None else max(until, newest)
+
+    def _record(self, hour, real, pred):
+        '''
+            Add the error of one matched hour to the totals and windows
+        '''
+        #the percentage error is undefined when the real aqi is 0
+        if real == 0 or np.isnan(real) or np.isnan(pred):
+            self.zero_aqi_hours += 1
+            return
+
+        error = abs(real - pred) / real * 100
+        self.total += error
+        self.count += 1
+        if self.latest is None or hour > self.latest:
+            self.latest = hour
+        day = hour.astype('datetime64[D]')
+        day_total, day_count = self._days.get(day, (0.0, 0))
+        self._days[day] = (day_total + error, day_count + 1)
+
+        for name, length in self.windows.items():
+            entries = self._entries[name]
+            if not entries or hour >= entries[-1][0]:
+                entries.append((hour, error))
+            else:
+                #out of order rows are rare, keep the deque sorted
+                items = list(entries)
+                bisect.insort(items, (hour, error))
+                self._entries[name] = entries = deque(items)
+            self._sums[name] += error
+
+            #drop everything that fell out of the window
+            cutoff = self.latest - np.timedelta64(length)
+            while entries and entries[0][0] <= cutoff:
+                self._sums[name] -= entries.popleft()[1]
+
+    def mape(self):
+        '''
+            MAPE over every matched hour
+        '''
+        return self.total / self.count if self.count else np.nan
+
+    def window_mape(self, name):
+        '''
+            MAPE over a rolling window ending at the latest matched hour
+        '''
+        entries = self._entries[name]
+        return self._sums[name] / len(entries) if entries else np.nan
+
+    def daily_errors(self):
+        '''
+            (sum, count) of the errors of every matched day
+        '''
+        with self._lock:
+            return dict(self._days)
+
+    def stats(self):
+        with self._lock:
+            stats = {
+                'mape':
+                    self.mape(),
+                'hours':
+                    self.count,
+                'zero_aqi_hours':
+                    self.zero_aqi_hours,
+                'latest':
+                    pd.Timestamp(self.latest)
+                    if self.latest is not None else None,
+            }
+            for name in self.windows:
+                stats[f'mape_{name}'] = self.window_mape(name)
+            return stats
+
+    @property
+    def real_until(self):
+        '''
+            Newest real hour seen so far
+        '''
+        return self._real_until
+
+    @property
+    def pred_until(self):
+        '''
+            Newest predicted hour seen so far
+        '''
+        return self._pred_until
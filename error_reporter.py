@@ -0,0 +1,165 @@
+import atexit
+import datetime
+import json
+import os
+import queue
+import threading
+import time
+
+
+class ErrorReporter:
+    '''
+        Sends model error (MAPE) samples to the backend from a background
+        thread. Samples are coalesced per (city, state, hour) and flushed in
+        batches, callers never wait on the backend.
+    '''
+
+    def __init__(self,
+                 send,
+                 max_queue=1000,
+                 batch_size=20,
+                 flush_interval=60,
+                 spill_path=None):
+        #send(city, state, mape, when) returns None when the insert failed
+        self.send = send
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spill_path = spill_path
+        self.sent = 0
+        self.dropped = 0
+        self.spilled = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._pending = {}
+        self._stop = threading.Event()
+        self._spill_lock = threading.Lock()
+        #one flush at a time, the worker and close may both flush
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def submit(self, city, state, mape, when=None):
+        '''
+            Queue a sample without blocking. When the queue is full the
+            sample is spilled to disk, or dropped if there is no spill file.
+        '''
+        #nothing to report if there was no overlap to compute it on
+        if mape != mape:
+            return
+        self._ensure_started()
+        sample = (city.lower(), state.lower(), float(mape),
+                  (when or datetime.datetime.now()).replace(minute=0,
+                                                            second=0,
+                                                            microsecond=0))
+        try:
+            self._queue.put_nowait(sample)
+        except queue.Full:
+            self._spill([sample])
+
+    def _ensure_started(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run,
+                                                name='aqi-error-reporter',
+                                                daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def _run(self):
+        #send what could not be sent before the last shutdown first
+        self._load_spilled()
+        last_flush = time.monotonic()
+        while not self._stop.is_set():
+            try:
+                self._add(self._queue.get(timeout=1))
+            except queue.Empty:
+                pass
+            if (len(self._pending) >= self.batch_size or
+                    time.monotonic() - last_flush >= self.flush_interval):
+                self._flush()
+                last_flush = time.monotonic()
+
+    def _add(self, sample):
+        '''
+            Coalesce a sample with the others of the same city and hour
+        '''
+        city, state, mape, hour = sample
+        total, count = self._pending.get((city, state, hour), (0.0, 0))
+        self._pending[(city, state, hour)] = (total + mape, count + 1)
+
+    def _flush(self):
+        '''
+            Send the mean MAPE of every pending (city, state, hour). After a
+            flush that reached the backend, spilled samples are sent again.
+        '''
+        with self._flush_lock:
+            pending, self._pending = self._pending, {}
+            failed = []
+            for (city, state, hour), (total, count) in pending.items():
+                if self.send(city, state, total / count, hour) is None:
+                    failed.append((city, state, total / count, hour))
+                else:
+                    self.sent += 1
+            if failed:
+                self._spill(failed)
+            elif pending:
+                #the backend is reachable again, retry what was spilled
+                self._load_spilled()
+
+    def _spill(self, samples):
+        '''
+            Append samples to the spill file, or drop them without one
+        '''
+        if not samples:
+            return
+        if self.spill_path is None:
+            self.dropped += len(samples)
+            return
+        with self._spill_lock:
+            try:
+                os.makedirs(os.path.dirname(self.spill_path) or '.',
+                            exist_ok=True)
+                with open(self.spill_path, 'a') as spill:
+                    for city, state, mape, hour in samples:
+                        spill.write(
+                            json.dumps([city, state, mape,
+                                        hour.isoformat()]) + '\n')
+                self.spilled += len(samples)
+            except OSError:
+                self.dropped += len(samples)
+
+    def _load_spilled(self):
+        if self.spill_path is None or not os.path.exists(self.spill_path):
+            return
+        with self._spill_lock:
+            with open(self.spill_path) as spill:
+                lines = spill.readlines()
+            os.remove(self.spill_path)
+        for line in lines:
+            city, state, mape, hour = json.loads(line)
+            self._add(
+                (city, state, mape, datetime.datetime.fromisoformat(hour)))
+
+    def close(self):
+        '''
+            Stop the worker and flush everything still queued
+        '''
+        if self._thread is None or self._stop.is_set():
+            return
+        self._stop.set()
+        self._thread.join(timeout=5)
+        queued = []
+        while True:
+            try:
+                queued.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if self._thread.is_alive():
+            #the worker is stuck sending, keep the rest for the next start
+            self._spill(queued)
+            return
+        for sample in queued:
+            self._add(sample)
+        self._flush()
+        #samples reloaded from the spill file by a successful flush
+        if self._pending:
+            self._flush()
@@ -0,0 +1,203 @@
+'''
+    Local stand-in for the AQI backend, for benchmarks and load tests.
+    Run with: python fake_backend.py --rows 1000 --latency 0.05 --port 8000
+    and point the app at it with url=http://127.0.0.1:8000
+'''
+import argparse
+import bisect
+import datetime
+import gzip
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+#same as history.BACKEND_FORMAT, the fake backend needs no third party
+#packages
+BACKEND_FORMAT = '%d/%m/%Y %H:%M:%S'
+
+
+def make_rows(rows, value_key, start=datetime.datetime(2022, 11, 21)):
+    '''
+        Hourly rows shaped like the ones of the real backend
+    '''
+    step = datetime.timedelta(hours=1)
+    return [{
+        'datetime': (start + i * step).strftime(BACKEND_FORMAT),
+        'city': 'mumbai',
+        'state': 'maharashtra',
+        value_key: round(random.uniform(20, 400), 2)
+    } for i in range(rows)]
+
+
+class FakeBackend(ThreadingHTTPServer):
+    '''
+        Serves /retrieve, /retrieve_all and /insert_error with a configurable
+        payload size, latency and error rate. GETs carry an ETag and are
+        gzipped when the client accepts it.
+    '''
+    daemon_threads = True
+
+    def __init__(self,
+                 port=0,
+                 rows=1000,
+                 latency=0.0,
+                 error_rate=0.0,
+                 honor_windows=True):
+        super().__init__(('127.0.0.1', port), _Handler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.honor_windows = honor_windows
+        self.requests = 0
+        self.not_modified = 0
+        self.inserted = []
+        #the predictions run 48 hours past the real time data
+        self.data = {
+            '/retrieve': make_rows(rows, 'aqi'),
+            '/retrieve_all': make_rows(rows + 48, 'yhat'),
+        }
+        self.times = {
+            endpoint: [
+                datetime.datetime.strptime(row['datetime'], BACKEND_FORMAT)
+                for row in rows
+            ] for endpoint, rows in self.data.items()
+        }
+        self.bodies = {}
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def start(self):
+        '''
+            Serve on a background thread, return self
+        '''
+        threading.Thread(target=self.serve_forever,
+                         name='fake-backend',
+                         daemon=True).start()
+        return self
+
+    def select(self, endpoint, query):
+        '''
+            Rows of an endpoint, cut to the start/end/since parameters
+        '''
+        rows = self.data[endpoint]
+        windowed = {'start', 'end', 'since'} & set(query)
+        if not self.honor_windows or not windowed:
+            return rows
+
+        def parse(name):
+            return datetime.datetime.strptime(query[name][0], BACKEND_FORMAT)
+
+        #the rows are in time order
+        times = self.times[endpoint]
+        lo, hi = 0, len(rows)
+        if 'start' in query:
+            lo = bisect.bisect_left(times, parse('start'))
+        if 'since' in query:
+            lo = max(lo, bisect.bisect_right(times, parse('since')))
+        if 'end' in query:
+            hi = bisect.bisect_left(times, parse('end'))
+        return rows[lo:hi]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def _reply(self, status, payload, etag=None):
+        body = payload if isinstance(payload,
+                                     bytes) else json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        if etag is not None:
+            self.send_header('ETag', etag)
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            body = gzip.compress(body, compresslevel=5)
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _reply_json(self, body):
+        '''
+            Reply with a JSON body, or 304 if the client already has it
+        '''
+        etag = f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+        if self.headers.get('If-None-Match') == etag:
+            self.server.not_modified += 1
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self._reply(200, body, etag)
+
+    def _handle(self):
+        server = self.server
+        server.requests += 1
+        if server.latency:
+            time.sleep(server.latency)
+        if random.random() < server.error_rate:
+            self._reply(503, {'error': 'injected failure'})
+            return None
+        url = urlparse(self.path)
+        return url.path.rstrip('/').replace('//', '/') or '/', parse_qs(
+            url.query)
+
+    def do_GET(self):
+        request = self._handle()
+        if request is None:
+            return
+        endpoint, query = request
+        if endpoint not in self.server.data:
+            self._reply(404, {'error': 'not found'})
+            return
+        rows = self.server.select(endpoint, query)
+        if rows is self.server.data[endpoint]:
+            #the full payload never changes, encode it once
+            if endpoint not in self.server.bodies:
+                self.server.bodies[endpoint] = json.dumps({
+                    'data': rows
+                }).encode()
+            self._reply_json(self.server.bodies[endpoint])
+        else:
+            self._reply_json(json.dumps({'data': rows}).encode())
+
+    def do_POST(self):
+        request = self._handle()
+        if request is None:
+            return
+        endpoint, query = request
+        if endpoint != '/insert_error':
+            self._reply(404, {'error': 'not found'})
+            return
+        self.server.inserted.append({
+            key: values[0] for key, values in query.items()
+        })
+        self._reply(200, {'status': 'ok'})
+
+    def log_message(self, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--rows', type=int, default=1000)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--ignore-windows',
+                        action='store_true',
+                        help='always send the full history')
+    args = parser.parse_args()
+    server = FakeBackend(args.port, args.rows, args.latency, args.error_rate,
+                         not args.ignore_windows)
+    print(f"Fake backend serving {args.rows} rows on {server.url}")
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
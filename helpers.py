@@ -0,0 +1,7 @@
+def redirect(_url):
+    '''
+        Redirect to a url
+    '''
+    #only the report page needs a browser
+    import webbrowser
+    webbrowser.open_new_tab(_url)
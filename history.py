@@ -0,0 +1,162 @@
+import sys
+import threading
+
+import numpy as np
+import pandas as pd
+
+#datetime format used by the backend
+BACKEND_FORMAT = '%d/%m/%Y %H:%M:%S'
+
+#windows remembered per history before they are dropped
+MAX_WINDOWS = 32
+
+
+def to_backend_time(timestamp):
+    return pd.Timestamp(timestamp).strftime(BACKEND_FORMAT)
+
+
+def rows_nbytes(rows, seen):
+    '''
+        About how many bytes a list of decoded rows holds: the list, the row
+        dicts and their keys and values. Objects whose id is in seen are
+        already counted elsewhere and skipped, the others are added to it.
+    '''
+    total = sys.getsizeof(rows)
+    for row in rows:
+        if id(row) in seen:
+            continue
+        seen.add(id(row))
+        total += sys.getsizeof(row)
+        for item in (*row.keys(), *row.values()):
+            if id(item) not in seen:
+                seen.add(id(item))
+                total += sys.getsizeof(item)
+    return total
+
+
+class PayloadHistory:
+    '''
+        Rows already fetched for one endpoint and city, kept in time order.
+        Only rows newer than the high-water mark (or older than what is
+        covered) are requested from the backend.
+    '''
+
+    def __init__(self):
+        self._rows = []
+        self._times = np.array([], dtype='datetime64[ns]')
+        #None means everything from the start of the data is covered
+        self.covered_from = None
+        self.high_water = None
+        self.loaded = False
+        #a 304 hands back the very same payload, it is merged already
+        self._last_payload = None
+        #windows handed out since the last change, so that callers get the
+        #same payload object for the same data and can memoize on it
+        self._windows = {}
+        #_lock guards the rows, _sync_lock keeps syncs from overlapping
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+
+    def sync(self, fetch, start=None):
+        '''
+            Bring the history up to date. fetch is called with the query
+            parameters and returns a backend payload or None.
+            Returns False if nothing has ever been loaded.
+        '''
+        #one sync at a time, but the requests are made without holding the
+        #lock that window() takes
+        with self._sync_lock:
+            if not self.loaded:
+                params = {'start': to_backend_time(start)} if start else {}
+                self.covered_from = start
+                self.loaded = self._merge(fetch(params), start)
+                return self.loaded
+
+            #backfill the part before what we already have
+            if self.covered_from is not None and (start is None or
+                                                  start < self.covered_from):
+                params = {'end': to_backend_time(self.covered_from)}
+                if start is not None:
+                    params['start'] = to_backend_time(start)
+                if (self._merge(fetch(params), start) and
+                        self.covered_from is not None):
+                    self.covered_from = start
+
+            #only ask for the rows newer than the high-water mark
+            if self.high_water is not None:
+                self._merge(fetch({'since': to_backend_time(self.high_water)}),
+                            self.covered_from)
+            return True
+
+    def _merge(self, payload, start):
+        '''
+            Merge the rows of a payload into the history.
+            Returns False if the request failed.
+        '''
+        if payload is None:
+            return False
+        if payload is self._last_payload:
+            return True
+        self._last_payload = payload
+        rows = payload['data']
+        if not rows:
+            return True
+        times = pd.to_datetime([row['datetime'] for row in rows],
+                               format=BACKEND_FORMAT).to_numpy()
+
+        with self._lock:
+            #the backend ignored the window and sent everything
+            if start is not None and times.min() < np.datetime64(start):
+                start = None
+                self.covered_from = None
+
+            self._windows.clear()
+            if self.high_water is not None and times.min() > self.high_water:
+                #plain delta, append at the end
+                order = np.argsort(times, kind='stable')
+                self._rows.extend(rows[i] for i in order)
+                self._times = np.concatenate([self._times, times[order]])
+            else:
+                #the backend sent rows we already have, dedupe by time and
+                #keep the newest copy
+                all_times = np.concatenate([self._times, times])
+                all_rows = self._rows + list(rows)
+                frame = pd.DataFrame({'time': all_times})
+                keep = frame.drop_duplicates('time', keep='last')
+                keep = keep.sort_values('time', kind='stable').index.to_numpy()
+                self._rows = [all_rows[i] for i in keep]
+                self._times = all_times[keep]
+            self.high_water = self._times[-1]
+        return True
+
+    def footprint(self, seen):
+        '''
+            Number of rows held and about how many bytes they take, see
+            rows_nbytes
+        '''
+        with self._lock:
+            return len(self._rows), rows_nbytes(self._rows, seen)
+
+    def window(self, start=None, end=None, since=None):
+        '''
+            Return a payload with the rows in [start, end), newer than since
+        '''
+        with self._lock:
+            if not self.loaded:
+                return None
+            key = (start, end, since)
+            if key in self._windows:
+                return self._windows[key]
+            lo, hi = 0, len(self._times)
+            if start is not None:
+                lo = np.searchsorted(self._times, np.datetime64(start), 'left')
+            if since is not None:
+                lo = max(
+                    lo,
+                    np.searchsorted(self._times, np.datetime64(since), 'right'))
+            if end is not None:
+                hi = np.searchsorted(self._times, np.datetime64(end), 'left')
+            if len(self._windows) >= MAX_WINDOWS:
+                self._windows.clear()
+            payload = self._windows[key] = {'data': self._rows[lo:hi]}
+            return payload
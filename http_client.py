@@ -0,0 +1,351 @@
+import codecs
+import contextvars
+import json
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import HTTPError as TransportError
+
+from instrumentation import span
+
+#status codes worth retrying, anything else is returned as is
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+#bytes read from the body at a time
+CHUNK_SIZE = 64 * 1024
+#start of the payloads of the backend, their rows are decoded as they arrive
+ROWS_START = re.compile(r'\s*\{\s*"data"\s*:\s*\[')
+ROW_SEPARATOR = re.compile(r'[\s,]*')
+ROW_END = re.compile(r'\s*[,\]]')
+
+#urllib3 only decodes brotli when the brotli package is installed
+try:
+    import brotli  # noqa: F401
+    ACCEPT_ENCODING = 'br, gzip, deflate'
+except ImportError:
+    ACCEPT_ENCODING = 'gzip, deflate'
+
+#requests that failed in the current context, whether or not the last good
+#payload was served instead, see collect_failures
+_failures = contextvars.ContextVar('aqi_request_failures', default=None)
+
+
+@contextmanager
+def collect_failures():
+    '''
+        Collect the GETs that failed inside the block, also the ones made on
+        pool threads with submit_traced. Callers that must not mistake the
+        last good payload for fresh data check the list.
+    '''
+    failures = []
+    token = _failures.set(failures)
+    try:
+        yield failures
+    finally:
+        _failures.reset(token)
+
+
+def decode_json_stream(chunks):
+    '''
+        Decode a JSON payload from chunks of bytes. The rows of a
+        {"data": [...]} payload are decoded one by one while the chunks
+        arrive, so only a chunk of text is held at a time. Other payloads
+        are decoded whole. Raises ValueError on a truncated or corrupt body.
+    '''
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+    chunks = (text_decoder.decode(chunk) for chunk in chunks)
+
+    text = ''
+    for chunk in chunks:
+        text += chunk
+        if len(text) >= 64:
+            break
+    start = ROWS_START.match(text)
+    if start is None:
+        return json.loads(text + ''.join(chunks) +
+                          text_decoder.decode(b'', final=True))
+
+    rows = []
+    position = start.end()
+    while True:
+        position = ROW_SEPARATOR.match(text, position).end()
+        if position < len(text) and text[position] == ']':
+            break
+        end = None
+        try:
+            row, end = decoder.raw_decode(text, position)
+        except ValueError:
+            pass
+        #a number cut at the end of the text decodes as a shorter number,
+        #only take a row once the separator after it has arrived
+        if end is None or ROW_END.match(text, end) is None:
+            #the row is not complete yet, keep what is left and read on
+            chunk = next(chunks, None)
+            if chunk is None:
+                raise ValueError(f"truncated or corrupt row: "
+                                 f"{text[position:position + 20]!r}")
+            text = text[position:] + chunk
+            position = 0
+            continue
+        rows.append(row)
+        position = end
+
+    #whatever follows the rows, usually just the closing brace
+    rest = (text[position + 1:] + ''.join(chunks) +
+            text_decoder.decode(b'', final=True)).strip()
+    if rest == '}':
+        return {'data': rows}
+    if rest.startswith(','):
+        return {'data': rows, **json.loads('{' + rest[1:])}
+    raise ValueError(f"unexpected end of payload: {rest[:20]!r}")
+
+
+class RetryBudget:
+    '''
+        Limit retries to a fraction of the requests made, across all
+        sessions, so that a struggling backend is not flooded with retries
+    '''
+
+    def __init__(self, ratio, min_tokens=10):
+        self.ratio = ratio
+        self.max_tokens = min_tokens
+        self._tokens = float(min_tokens)
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        '''
+            Earn a fraction of a retry for every first attempt
+        '''
+        with self._lock:
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def withdraw(self):
+        '''
+            Spend one retry, return False if the budget is exhausted
+        '''
+        with self._lock:
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+
+class CircuitBreaker:
+    '''
+        Stop calling the backend after repeated failures and let a single
+        probe through once the reset timeout has passed
+    '''
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        '''
+            Return True if a request may be sent to the backend
+        '''
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._probing:
+                return False
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                #half open, let one request through to test the backend
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+    @property
+    def is_open(self):
+        return self._opened_at is not None
+
+
+class BackendClient:
+    '''
+        Pooled keep-alive client for the AQI backend, shared by all sessions
+    '''
+
+    def __init__(self,
+                 base_url,
+                 pool_size=10,
+                 timeout=(3.05, 15),
+                 endpoint_timeouts=None,
+                 max_retries=2,
+                 backoff=0.3,
+                 retry_budget=None,
+                 breaker=None):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.endpoint_timeouts = endpoint_timeouts or {}
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.retry_budget = retry_budget or RetryBudget(0.1)
+        self.breaker = breaker or CircuitBreaker(5, 30)
+        self._last_good = {}
+        #ETag and Last-Modified of the last good payload of every request
+        self._validators = {}
+        self.not_modified = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+
+        #bounded pool, threads block for a free connection instead of
+        #opening new ones
+        adapter = HTTPAdapter(pool_connections=1,
+                              pool_maxsize=pool_size,
+                              pool_block=True,
+                              max_retries=0)
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers['Accept-Encoding'] = ACCEPT_ENCODING
+
+    def get_json(self, endpoint, params):
+        '''
+            GET an endpoint and return the decoded JSON, or None on failure.
+            While the backend is unhealthy the last good payload is returned.
+            Requests are conditional, when the backend answers 304 the last
+            good payload is returned as is, without decoding anything.
+        '''
+        key = (endpoint, tuple(sorted(params.items())))
+        if not self.breaker.allow():
+            return self._failed(key)
+        with self._lock:
+            headers = self._validators.get(key, {})
+
+        with span(f'GET {endpoint}') as record:
+            response = self._send('GET',
+                                  endpoint,
+                                  params,
+                                  retry=True,
+                                  headers=headers,
+                                  stream=True)
+            if response is None:
+                return self._failed(key)
+            with response:
+                record['status'] = response.status_code
+                if response.status_code == 304:
+                    with self._lock:
+                        self.not_modified += 1
+                        return self._last_good.get(key)
+                if response.status_code != 200:
+                    self._failed(key)
+                    return None
+                try:
+                    with span('json decode') as decode:
+                        #decompressed and decoded while the body arrives
+                        payload = decode_json_stream(
+                            response.iter_content(CHUNK_SIZE))
+                        record['bytes'] = decode['bytes'] = response.raw.tell()
+                except (requests.RequestException, TransportError, OSError,
+                        ValueError):
+                    #the connection broke while the body was read, or the
+                    #body is truncated or corrupt
+                    self.breaker.record_failure()
+                    return self._failed(key)
+                validators = {}
+                if 'ETag' in response.headers:
+                    validators['If-None-Match'] = response.headers['ETag']
+                if 'Last-Modified' in response.headers:
+                    validators['If-Modified-Since'] = response.headers[
+                        'Last-Modified']
+        with self._lock:
+            self._last_good[key] = payload
+            self._validators[key] = validators
+        return payload
+
+    def last_good_payloads(self):
+        '''
+            (endpoint, params, payload) of every last good payload kept to
+            serve while the backend is unhealthy
+        '''
+        with self._lock:
+            return [(endpoint, dict(params), payload)
+                    for (endpoint, params), payload in self._last_good.items()]
+
+    def _failed(self, key):
+        '''
+            Record a failed GET, return the last good payload of it
+        '''
+        failures = _failures.get()
+        if failures is not None:
+            failures.append(key)
+        with self._lock:
+            self.failures += 1
+            return self._last_good.get(key)
+
+    def post_json(self, endpoint, params):
+        '''
+            POST to an endpoint and return the decoded JSON, or None on
+            failure. Posts are not idempotent so they are never retried.
+        '''
+        if not self.breaker.allow():
+            return None
+        response = self._send('POST', endpoint, params, retry=False)
+        if response is not None and response.status_code == 200:
+            return response.json()
+        return None
+
+    def _send(self,
+              method,
+              endpoint,
+              params,
+              retry,
+              headers=None,
+              stream=False):
+        '''
+            Send a request with jittered retries, return None if the backend
+            could not be reached
+        '''
+        timeout = self.endpoint_timeouts.get(endpoint, self.timeout)
+        self.retry_budget.deposit()
+        attempt = 0
+        while True:
+            try:
+                response = self.session.request(method,
+                                                f"{self.base_url}{endpoint}",
+                                                params=params,
+                                                headers=headers,
+                                                timeout=timeout,
+                                                stream=stream)
+            except requests.RequestException:
+                response = None
+
+            failed = response is None or response.status_code in RETRY_STATUS_CODES
+            if not failed:
+                self.breaker.record_success()
+                return response
+
+            self.breaker.record_failure()
+            if response is not None:
+                #give the connection back to the pool
+                response.close()
+            if (not retry or attempt >= self.max_retries or
+                    self.breaker.is_open or not self.retry_budget.withdraw()):
+                return None
+
+            #full jitter exponential backoff
+            time.sleep(random.uniform(0, self.backoff * 2**attempt))
+            attempt += 1
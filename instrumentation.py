@@ -0,0 +1,227 @@
+'''
+    Lightweight timing spans for the stages of a rerun.
+    Every span is added to process-wide totals that can be exported in
+    Prometheus text format, and logged as a JSON line on the aqi.timing
+    logger when it is enabled for INFO (see start_timing_log).
+'''
+import contextvars
+import functools
+import io
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger('aqi.timing')
+
+#name -> {'count', 'seconds', 'bytes', 'rows'}
+_totals = {}
+_totals_lock = threading.Lock()
+#spans of the current rerun, and the spans open in this context. Context
+#variables follow the work into pool threads started with submit_traced.
+_trace = contextvars.ContextVar('aqi_trace', default=None)
+_stack = contextvars.ContextVar('aqi_span_stack', default=())
+
+
+def start_trace():
+    '''
+        Start collecting the spans of a rerun in the current context
+    '''
+    _trace.set([])
+    _stack.set(())
+
+
+def current_trace():
+    '''
+        Spans recorded in the current context since start_trace, including
+        the ones of tasks submitted with submit_traced
+    '''
+    return list(_trace.get() or [])
+
+
+def submit_traced(pool, function, *args, **kwargs):
+    '''
+        Submit a task to an executor so that its spans are added to the
+        trace of the caller
+    '''
+    return pool.submit(contextvars.copy_context().run, function, *args,
+                       **kwargs)
+
+
+@contextmanager
+def span(name, **attrs):
+    '''
+        Time a block of code. Attributes like bytes and rows can be passed
+        here or added from inside the block with annotate.
+    '''
+    record = {'span': name, **attrs}
+    #a new tuple, tasks running in copies of this context keep their own
+    token = _stack.set(_stack.get() + (record,))
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record['seconds'] = time.perf_counter() - start
+        _stack.reset(token)
+        _finish(record)
+
+
+def annotate(**attrs):
+    '''
+        Add attributes to the innermost open span of this context
+    '''
+    stack = _stack.get()
+    if stack:
+        stack[-1].update(attrs)
+
+
+def timed(name):
+    '''
+        Decorator that wraps every call of a function in a span
+    '''
+
+    def decorator(function):
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def _finish(record):
+    '''
+        Log a finished span and add it to the totals
+    '''
+    #serializing every span costs more than the span itself
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(json.dumps(record, default=str))
+    with _totals_lock:
+        totals = _totals.setdefault(record['span'], {
+            'count': 0,
+            'seconds': 0.0,
+            'bytes': 0,
+            'rows': 0
+        })
+        totals['count'] += 1
+        totals['seconds'] += record['seconds']
+        totals['bytes'] += record.get('bytes', 0)
+        totals['rows'] += record.get('rows', 0)
+    trace = _trace.get()
+    if trace is not None:
+        trace.append(record)
+
+
+def metrics_text():
+    '''
+        Totals of every span in the Prometheus text exposition format
+    '''
+    lines = []
+    with _totals_lock:
+        totals = {name: dict(values) for name, values in _totals.items()}
+    for metric, field, help_text in [
+        ('aqi_stage_calls_total', 'count', 'Number of calls of a stage'),
+        ('aqi_stage_seconds_total', 'seconds', 'Time spent in a stage'),
+        ('aqi_stage_bytes_total', 'bytes', 'Payload bytes handled by a stage'),
+        ('aqi_stage_rows_total', 'rows', 'Rows handled by a stage'),
+    ]:
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} counter")
+        for name, values in sorted(totals.items()):
+            lines.append(f'{metric}{{stage="{name}"}} {values[field]}')
+    return '\n'.join(lines) + '\n'
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path != '/metrics':
+            self.send_error(404)
+            return
+        body = metrics_text().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port):
+    '''
+        Serve /metrics on a background thread, once per process
+    '''
+    global _server
+    with _server_lock:
+        if _server is None:
+            _server = ThreadingHTTPServer(('', port), _MetricsHandler)
+            threading.Thread(target=_server.serve_forever,
+                             name='aqi-metrics',
+                             daemon=True).start()
+
+
+_log_lock = threading.Lock()
+
+
+def start_timing_log(target):
+    '''
+        Log every span as a JSON line to stderr, or to a file when target is
+        a path, once per process
+    '''
+    with _log_lock:
+        if logger.handlers:
+            return
+        if target == 'stderr':
+            handler = logging.StreamHandler()
+        else:
+            handler = logging.FileHandler(target)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        #the lines are JSON, keep them out of the root handlers
+        logger.propagate = False
+
+
+@contextmanager
+def profile_rerun(profiler):
+    '''
+        Profile a whole rerun with cProfile or pyinstrument. The yielded
+        dict gets the text report under 'report' when the block ends.
+    '''
+    result = {}
+    if profiler == 'pyinstrument':
+        #optional, only needed when this profiler is selected
+        from pyinstrument import Profiler
+        sampler = Profiler()
+        sampler.start()
+        try:
+            yield result
+        finally:
+            sampler.stop()
+            result['report'] = sampler.output_text()
+    elif profiler == 'cprofile':
+        import cProfile
+        import pstats
+        tracer = cProfile.Profile()
+        tracer.enable()
+        try:
+            yield result
+        finally:
+            tracer.disable()
+            output = io.StringIO()
+            pstats.Stats(tracer,
+                         stream=output).sort_stats('cumulative').print_stats(30)
+            result['report'] = output.getvalue()
+    else:
+        yield result
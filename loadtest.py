@@ -0,0 +1,363 @@
+'''
+    Load test of the app: one `streamlit run` server, the way a dyno runs
+    it, and N concurrent sessions connected to it over its websocket like
+    browser tabs, going through the AQI Prediction flows against the local
+    fake backend, for every concurrency level. Reports rerun latency,
+    throughput and the RSS of the server, writes them to a JSON file and
+    compares them with a previous run. Exits with an error when a level has
+    failed reruns or none at all.
+    Needs the packages of requirements-dev.txt.
+    Run with: python loadtest.py --concurrency 1,2,4,8 [--baseline old.json]
+'''
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+from tornado.websocket import websocket_connect
+
+from bench_app import FLOWS, point_app_at, percentile
+from fake_backend import FakeBackend
+
+
+def rss_mb(pid):
+    '''
+        Resident set size of a process in MB
+    '''
+    try:
+        with open(f"/proc/{pid}/statm") as statm:
+            pages = int(statm.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (OSError, ValueError):
+        #no /proc outside linux
+        kilobytes = subprocess.run(
+            ['ps', '-o', 'rss=', '-p', str(pid)],
+            capture_output=True,
+            text=True).stdout
+        return int(kilobytes) / 2**10 if kilobytes.strip() else float('nan')
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+def start_app(port, timeout=60):
+    '''
+        Start the app with streamlit run and wait until it answers
+    '''
+    command = [
+        sys.executable, '-m', 'streamlit', 'run', 'app.py',
+        '--server.headless=true', f"--server.port={port}",
+        '--server.fileWatcherType=none', '--browser.gatherUsageStats=false'
+    ]
+    process = subprocess.Popen(command,
+                               stdout=subprocess.DEVNULL,
+                               stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"streamlit run exited with {process.returncode}")
+        try:
+            with urllib.request.urlopen(
+                    f"http://127.0.0.1:{port}/_stcore/health", timeout=1):
+                return process
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise SystemExit(f"the app did not start in {timeout} s")
+
+
+class Session:
+    '''
+        One browser tab: reruns the script over the websocket of the server
+        with widget values, and remembers the widgets it was sent
+    '''
+
+    def __init__(self, url, timeout=60):
+        self.url = url
+        self.timeout = timeout
+        self.connection = None
+        self.widgets = {}
+
+    async def open_prediction_page(self):
+        self.connection = await websocket_connect(self.url,
+                                                  subprotocols=['streamlit'])
+        await self.rerun()
+        await self.rerun(self.select("Choose the app mode", "AQI Prediction"))
+
+    def select(self, label, option):
+        '''
+            Widget state of a selectbox set to one of its options
+        '''
+        widget = self.widgets[('selectbox', label)]
+        return WidgetState(id=widget.id,
+                           int_value=list(widget.options).index(option))
+
+    def click(self, label):
+        return WidgetState(id=self.widgets[('button', label)].id,
+                           trigger_value=True)
+
+    async def rerun(self, *widgets):
+        '''
+            Rerun the script with new widget values, return the time until it
+            finished
+        '''
+        message = BackMsg()
+        message.rerun_script.widget_states.widgets.extend(widgets)
+        start = time.perf_counter()
+        await self.connection.write_message(message.SerializeToString(),
+                                            binary=True)
+        await asyncio.wait_for(self._read_run(), self.timeout)
+        return time.perf_counter() - start
+
+    async def _read_run(self):
+        '''
+            Read the messages of a script run until it finished
+        '''
+        exceptions = []
+        while True:
+            payload = await self.connection.read_message()
+            if payload is None:
+                raise RuntimeError("the server closed the connection")
+            forward = ForwardMsg()
+            forward.ParseFromString(payload)
+            kind = forward.WhichOneof('type')
+            if kind == 'delta' and forward.delta.WhichOneof(
+                    'type') == 'new_element':
+                element = forward.delta.new_element
+                element_type = element.WhichOneof('type')
+                if element_type in ('selectbox', 'button'):
+                    widget = getattr(element, element_type)
+                    self.widgets[(element_type, widget.label)] = widget
+                elif element_type == 'exception':
+                    exceptions.append(element.exception.message)
+            elif kind == 'script_finished':
+                if forward.script_finished != ForwardMsg.FINISHED_SUCCESSFULLY:
+                    raise RuntimeError(
+                        f"script run ended with status {forward.script_finished}"
+                    )
+                if exceptions:
+                    raise RuntimeError(exceptions[0])
+                return
+
+    async def run_flows(self, reruns):
+        '''
+            Go through the flows in turn, return the timings of the Show
+            clicks and the errors
+        '''
+        timings, errors = [], []
+        for i in range(reruns):
+            flow = FLOWS[i % len(FLOWS)]
+            try:
+                await self.rerun(self.select("Select an operation", flow))
+                timings.append(await self.rerun(self.click("Show")))
+            except Exception as error:
+                errors.append(f"{flow}: {error!r}")
+        return timings, errors
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+
+
+async def run_sessions(url, concurrency, reruns):
+    '''
+        Open concurrency sessions, then start their flows at the same time
+    '''
+    sessions = [Session(url) for _ in range(concurrency)]
+    try:
+        opened = await asyncio.gather(
+            *(session.open_prediction_page() for session in sessions),
+            return_exceptions=True)
+        errors = [
+            f"page load: {error!r}" for error in opened
+            if isinstance(error, BaseException)
+        ]
+        ready = [
+            session for session, error in zip(sessions, opened)
+            if not isinstance(error, BaseException)
+        ]
+        start = time.perf_counter()
+        results = await asyncio.gather(
+            *(session.run_flows(reruns) for session in ready))
+        elapsed = time.perf_counter() - start
+    finally:
+        for session in sessions:
+            session.close()
+    timings = [
+        timing for session_timings, _ in results for timing in session_timings
+    ]
+    errors += [
+        error for _, session_errors in results for error in session_errors
+    ]
+    return timings, errors, elapsed
+
+
+def run_level(app, url, concurrency, reruns):
+    '''
+        Run concurrency sessions at the same time against the server, return
+        their statistics
+    '''
+    rss_start = rss_mb(app.pid)
+    timings, errors, elapsed = asyncio.run(
+        run_sessions(url, concurrency, reruns))
+    rss_end = rss_mb(app.pid)
+    level = {
+        'concurrency': concurrency,
+        'reruns': len(timings),
+        'errors': len(errors),
+        'throughput': len(timings) / elapsed if elapsed else 0.0,
+        'rss_mb': rss_end,
+        'rss_growth_mb': rss_end - rss_start,
+        'rss_per_session_mb': (rss_end - rss_start) / concurrency,
+    }
+    if timings:
+        level.update({
+            'p50': percentile(timings, 50),
+            'p95': percentile(timings, 95),
+            'p99': percentile(timings, 99),
+            'mean': statistics.mean(timings),
+        })
+    for error in errors[:3]:
+        print(f"  error: {error}")
+    return level
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                              capture_output=True,
+                              text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(levels, baseline, tolerance):
+    '''
+        Print the change of every level against a previous run, return the
+        regressions beyond the tolerance (a fraction)
+    '''
+    previous = {level['concurrency']: level for level in baseline['levels']}
+    print(f"\ncompared with {baseline.get('commit')} "
+          f"({baseline.get('started')})")
+    print(f"{'sessions':>8} {'p95 change':>11} {'throughput change':>18}")
+    regressions = []
+    for level in levels:
+        before = previous.get(level['concurrency'])
+        if before is None or 'p95' not in before or 'p95' not in level:
+            continue
+        p95_change = level['p95'] / before['p95'] - 1
+        throughput_change = (level['throughput'] / before['throughput'] -
+                             1 if before['throughput'] else 0.0)
+        print(f"{level['concurrency']:>8} {p95_change:>+11.1%} "
+              f"{throughput_change:>+18.1%}")
+        if p95_change > tolerance:
+            regressions.append(f"p95 at {level['concurrency']} sessions is "
+                               f"{p95_change:.0%} slower")
+        if throughput_change < -tolerance:
+            regressions.append(
+                f"throughput at {level['concurrency']} sessions is "
+                f"{-throughput_change:.0%} lower")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--concurrency',
+                        default='1,2,4,8',
+                        help='comma separated numbers of sessions')
+    parser.add_argument('--reruns',
+                        type=int,
+                        default=10,
+                        help='reruns per session')
+    parser.add_argument('--rows', type=int, default=1000)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--output',
+                        help='results file, loadtest-<time>.json by default')
+    parser.add_argument('--baseline', help='results of a previous run')
+    parser.add_argument('--tolerance',
+                        type=float,
+                        default=0.2,
+                        help='allowed slowdown against the baseline')
+    args = parser.parse_args()
+    levels = [int(level) for level in args.concurrency.split(',')]
+
+    server = FakeBackend(rows=args.rows, latency=args.latency).start()
+    point_app_at(server)
+    port = free_port()
+    app = start_app(port)
+    url = f"ws://127.0.0.1:{port}/_stcore/stream"
+    started = datetime.datetime.now()
+    rss_idle = rss_mb(app.pid)
+
+    print(f"server RSS before any session: {rss_idle:.1f} MB")
+    print(f"{'sessions':>8} {'p50 (s)':>8} {'p95 (s)':>8} {'p99 (s)':>8} "
+          f"{'reruns/s':>9} {'RSS MB':>7} {'RSS +MB':>8} {'errors':>7}")
+    results = []
+    try:
+        for concurrency in levels:
+            level = run_level(app, url, concurrency, args.reruns)
+            results.append(level)
+            print(f"{concurrency:>8} {level.get('p50', float('nan')):>8.3f} "
+                  f"{level.get('p95', float('nan')):>8.3f} "
+                  f"{level.get('p99', float('nan')):>8.3f} "
+                  f"{level['throughput']:>9.2f} {level['rss_mb']:>7.1f} "
+                  f"{level['rss_growth_mb']:>8.1f} "
+                  f"{level['errors']:>7}")
+    finally:
+        app.terminate()
+        app.wait()
+        print(f"backend requests: {server.requests}, "
+              f"not modified: {server.not_modified}")
+        server.shutdown()
+
+    #a run with failed reruns is not a valid baseline
+    failed = [
+        level['concurrency']
+        for level in results
+        if level['errors'] or not level['reruns']
+    ]
+    if failed:
+        print(f"FAIL: reruns failed at {failed} sessions, no results written")
+        sys.exit(1)
+
+    output = args.output or f"loadtest-{started:%Y%m%d-%H%M%S}.json"
+    with open(output, 'w') as results_file:
+        json.dump(
+            {
+                'started': started.isoformat(timespec='seconds'),
+                'commit': git_commit(),
+                'rows': args.rows,
+                'latency': args.latency,
+                'reruns_per_session': args.reruns,
+                'rss_idle_mb': rss_idle,
+                'levels': results,
+            },
+            results_file,
+            indent=2)
+    print(f"results written to {output}")
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(results, json.load(baseline_file),
+                                  args.tolerance)
+        for regression in regressions:
+            print(f"FAIL: {regression}")
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+'''
+    Background refresh of the data of the configured cities, so that reruns
+    read data that is already fetched and cleaned. The data being replaced
+    keeps being served until a refresh has fully succeeded.
+'''
+import logging
+import random
+import threading
+import time
+
+logger = logging.getLogger('aqi.refresh')
+
+
+class Refresher:
+    '''
+        Refreshes every city, then sleeps interval seconds plus a random
+        jitter so that several server processes do not hit the backend at
+        the same moment
+    '''
+
+    def __init__(self, cities, interval, jitter=0.0, refresh=None):
+        self.cities = list(cities)
+        self.interval = interval
+        self.jitter = jitter
+        #refresh(city, state) returns False when the data could not be fetched
+        self.refresh = refresh
+        self.runs = 0
+        self.failures = 0
+        self.last_refresh = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        '''
+            Run on a background thread, return self
+        '''
+        self._thread = threading.Thread(target=self._run,
+                                        name='aqi-refresher',
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        if self.refresh is None:
+            #imported here, on the refresher thread, so the data stack does
+            #not slow down the first page load
+            from api_connector import refresh_city
+            self.refresh = refresh_city
+        while not self._stop.is_set():
+            self.refresh_all()
+            self._stop.wait(self.interval + random.uniform(0, self.jitter))
+
+    def refresh_all(self):
+        '''
+            Refresh every city once
+        '''
+        for city, state in self.cities:
+            start = time.perf_counter()
+            try:
+                refreshed = self.refresh(city, state)
+            except Exception:
+                logger.exception("refreshing %s, %s failed", city, state)
+                refreshed = False
+            if refreshed:
+                self.last_refresh[(city, state)] = time.time()
+            else:
+                self.failures += 1
+            logger.info("refreshed %s, %s in %.3f s (%s)", city, state,
+                        time.perf_counter() - start,
+                        'ok' if refreshed else 'failed')
+        self.runs += 1
+
+    def stop(self):
+        self._stop.set()
+
+
+_refresher = None
+_refresher_lock = threading.Lock()
+
+
+def start_refresher(cities, interval, jitter):
+    '''
+        Start the refresher of the process, once per process
+    '''
+    global _refresher
+    with _refresher_lock:
+        if _refresher is None:
+            _refresher = Refresher(cities, interval, jitter).start()
+        return _refresher
@@ -0,0 +1,57 @@
+import io
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from cache import TTLCache, content_hash
+from decimate import decimate_series
+from env import cache_ttl, cache_max_entries, plot_points
+
+#rendered PNG images, keyed by a hash of what they show
+image_cache = TTLCache(cache_ttl, cache_max_entries)
+
+
+def _to_png(figure):
+    '''
+        Render a figure to PNG bytes and release it
+    '''
+    try:
+        FigureCanvasAgg(figure)
+        buffer = io.BytesIO()
+        figure.savefig(buffer, format='png')
+        return buffer.getvalue()
+    finally:
+        figure.clear()
+
+
+def _set_ticks(axes, x):
+    '''
+        Show only the first, middle and last label on the x axis
+    '''
+    axes.set_xticks([x[0], x[len(x) // 2], x[-1]])
+
+
+def render_line_chart(x, lines, title, xlabel):
+    '''
+        Render one or more lines sharing the same x values to a PNG image.
+        lines is a list of (y values, label) pairs, label may be None.
+    '''
+    x = np.asarray(x)
+    key = ('line', title, xlabel, tuple(label for _, label in lines),
+           content_hash(x, *(np.asarray(y, dtype='float64') for y, _ in lines)))
+
+    def render():
+        figure = Figure()
+        axes = figure.subplots()
+        for y, label in lines:
+            axes.plot(*decimate_series(x, y, plot_points), label=label)
+        _set_ticks(axes, x)
+        if any(label is not None for _, label in lines):
+            axes.legend()
+        axes.set_xlabel(xlabel)
+        axes.set_ylabel('AQI')
+        axes.set_title(title)
+        return _to_png(figure)
+
+    return image_cache.get_or_load(key, render)
@@ -0,0 +1,135 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+from aqi_scale import AQI_CLASSES
+from series import aqi_class_codes
+
+
+def week_start(day):
+    '''
+        Monday of the week of a datetime64[D] day
+    '''
+    #the epoch was a thursday
+    return day - (day.astype(np.int64) + 3) % 7
+
+
+def summarize(values):
+    '''
+        Statistics of the hourly AQI values of one day or week
+    '''
+    values = values[~np.isnan(values)]
+    if len(values):
+        mean, peak = values.mean(), values.max()
+        p95 = np.percentile(values, 95)
+    else:
+        mean = peak = p95 = np.nan
+    counts = np.bincount(aqi_class_codes(values), minlength=len(AQI_CLASSES))
+    return {
+        'hours': len(values),
+        'mean_aqi': mean,
+        'max_aqi': peak,
+        'p95_aqi': p95,
+        **dict(zip(AQI_CLASSES, counts.tolist())),
+    }
+
+
+class Rollup:
+    '''
+        Daily and weekly statistics of one hourly AQI series. Only the rows
+        newer than the ones already seen are added, and only the days and
+        weeks they fall in are computed again.
+    '''
+
+    def __init__(self):
+        #hourly values of every day, the weeks are summarized from these
+        self._values = {}
+        self._daily = {}
+        self._weekly = {}
+        self._until = None
+        self._lock = threading.Lock()
+
+    def update(self, df):
+        '''
+            Add the rows of a cleaned dataframe that arrived since the last
+            update
+        '''
+        with self._lock:
+            if self._until is not None:
+                df = df[df['date_time'] > self._until]
+            if df.empty:
+                return
+
+            hours = df['date_time'].to_numpy()
+            days = hours.astype('datetime64[D]')
+            order = np.argsort(days, kind='stable')
+            days = days[order]
+            values = df['aqi'].to_numpy(dtype='float64')[order]
+
+            #one chunk of values per day
+            starts = np.flatnonzero(np.r_[True, days[1:] != days[:-1]])
+            weeks = set()
+            for day, chunk in zip(days[starts], np.split(values, starts[1:])):
+                if day in self._values:
+                    chunk = np.concatenate([self._values[day], chunk])
+                self._values[day] = chunk
+                self._daily[day] = summarize(chunk)
+                weeks.add(week_start(day))
+            for week in weeks:
+                chunks = [
+                    self._values[day]
+                    for day in week + np.arange(7)
+                    if day in self._values
+                ]
+                self._weekly[week] = summarize(np.concatenate(chunks))
+
+            newest = hours.max()
+            self._until = newest if self._until is None else max(
+                self._until, newest)
+
+    @property
+    def until(self):
+        '''
+            Newest hour seen so far
+        '''
+        return self._until
+
+    def daily(self, errors=None):
+        '''
+            One row of statistics per day, with the MAPE of the day when the
+            daily (sum, count) of the errors are given
+        '''
+        with self._lock:
+            rows = sorted(self._daily.items())
+        return _to_frame('date', rows, errors or {}, lambda day: [day])
+
+    def weekly(self, errors=None):
+        '''
+            One row of statistics per week, starting on mondays
+        '''
+        with self._lock:
+            rows = sorted(self._weekly.items())
+        return _to_frame('week', rows, errors or {},
+                         lambda week: week + np.arange(7))
+
+
+def _to_frame(column, rows, errors, days_of):
+    '''
+        Dataframe of summarized rows, keyed by a date column
+    '''
+    df = pd.DataFrame(
+        [summary for _, summary in rows],
+        columns=['hours', 'mean_aqi', 'max_aqi', 'p95_aqi', *AQI_CLASSES])
+    df.insert(0, column,
+              np.array([key for key, _ in rows], dtype='datetime64[ns]'))
+    mape = []
+    for key, _ in rows:
+        total = count = 0
+        for day in days_of(key):
+            day_total, day_count = errors.get(day, (0.0, 0))
+            total += day_total
+            count += day_count
+        mape.append(total / count if count else np.nan)
+    df['mape'] = mape
+    return df
@@ -0,0 +1,224 @@
+import numpy as np
+import pandas as pd
+
+from aqi_scale import AQI_BREAKPOINTS, AQI_CLASSES
+
+AQI_BOUNDS = np.array([bound for bound, _, _ in AQI_BREAKPOINTS[:-1]])
+
+#float32 keeps about 7 significant digits, round back to what it can hold
+#when converting to float64
+AQI_DECIMALS = 4
+
+
+def aqi_class_codes(aqi):
+    '''
+        Index into AQI_CLASSES of every value, -1 for missing values
+    '''
+    values = np.asarray(aqi, dtype='float64')
+    codes = np.searchsorted(AQI_BOUNDS, values, side='left').astype(np.int8)
+    codes[np.isnan(values)] = -1
+    return codes
+
+
+class AQISeries:
+    '''
+        Compact hourly AQI series: int32 hours since the epoch, float32 AQI
+        and int8 class codes. Windows are views, they do not copy the data.
+    '''
+    __slots__ = ('hours', 'aqi', 'classes')
+
+    def __init__(self, hours, aqi, classes):
+        self.hours = hours
+        self.aqi = aqi
+        self.classes = classes
+
+    @classmethod
+    def from_frame(cls, df):
+        '''
+            Build a series from a cleaned dataframe with date_time and aqi
+        '''
+        df = df.sort_values('date_time', kind='stable')
+        return cls(
+            _epoch_hours(df['date_time']),
+            df['aqi'].to_numpy(dtype=np.float32),
+            aqi_class_codes(df['aqi']),
+        )
+
+    def __len__(self):
+        return len(self.hours)
+
+    @property
+    def nbytes(self):
+        return self.hours.nbytes + self.aqi.nbytes + self.classes.nbytes
+
+    def window(self, start=None, end=None):
+        '''
+            The part of the series in [start, end), without copying
+        '''
+        lo, hi = 0, len(self.hours)
+        if start is not None:
+            lo = np.searchsorted(self.hours, _to_hour(start), 'left')
+        if end is not None:
+            hi = np.searchsorted(self.hours, _to_hour(end), 'left')
+        return AQISeries(self.hours[lo:hi], self.aqi[lo:hi],
+                         self.classes[lo:hi])
+
+    def to_frame(self, with_class=False):
+        '''
+            Dataframe with date_time and aqi columns, like the cleaning
+            functions return
+        '''
+        df = pd.DataFrame({
+            'date_time': _to_datetime(self.hours),
+            'aqi': self.aqi.astype(np.float64).round(AQI_DECIMALS),
+        })
+        if with_class:
+            df['aqi_class'] = pd.Categorical.from_codes(self.classes,
+                                                        categories=AQI_CLASSES,
+                                                        ordered=True)
+        return df
+
+
+class AlignedSeries:
+    '''
+        Real and predicted AQI on one hourly axis: position i holds the hour
+        start + i, with NaN where a side has no value. Ranges and horizons
+        are found with arithmetic, without merging or searching.
+    '''
+    __slots__ = ('start', 'real', 'predicted')
+
+    def __init__(self, start, real, predicted):
+        self.start = start
+        self.real = real
+        self.predicted = predicted
+
+    @classmethod
+    def from_frames(cls, df_real, df_pred):
+        '''
+            Align cleaned real time and predicted dataframes, either may be
+            None
+        '''
+        sides = [(df, _epoch_hours(df['date_time'])) if df is not None else None
+                 for df in (df_real, df_pred)]
+        hours = [side[1] for side in sides if side is not None]
+        hours = [side for side in hours if len(side)]
+        if not hours:
+            return cls(0, np.array([]), np.array([]))
+        start = min(side.min() for side in hours)
+        length = max(side.max() for side in hours) - start + 1
+
+        arrays = []
+        for side in sides:
+            values = np.full(length, np.nan)
+            if side is not None:
+                df, side_hours = side
+                values[side_hours - start] = df['aqi'].to_numpy(dtype='float64')
+            arrays.append(values)
+        return cls(int(start), *arrays)
+
+    def __len__(self):
+        return len(self.real)
+
+    def _offset(self, timestamp):
+        '''
+            Position of a timestamp on the axis, clipped to it
+        '''
+        return min(max(int(_to_hour(timestamp)) - self.start, 0), len(self))
+
+    def _cut(self, lo, hi):
+        return AlignedSeries(self.start + lo, self.real[lo:hi],
+                             self.predicted[lo:hi])
+
+    def slice(self, start=None, end=None):
+        '''
+            The part of the axis in [start, end), without copying
+        '''
+        lo = 0 if start is None else self._offset(start)
+        hi = len(self) if end is None else self._offset(end)
+        return self._cut(lo, max(lo, hi))
+
+    def last_real(self):
+        '''
+            Position of the newest hour with a real value, -1 if none
+        '''
+        seen = np.flatnonzero(~np.isnan(self.real))
+        return seen[-1] if len(seen) else -1
+
+    def horizon(self, hours, origin=None):
+        '''
+            The next hours after origin, by default after the newest real
+            value, without copying
+        '''
+        if origin is None:
+            lo = self.last_real() + 1
+        else:
+            lo = int(_to_hour(origin)) - self.start + 1
+        lo = min(max(lo, 0), len(self))
+        return self._cut(lo, min(lo + hours, len(self)))
+
+    def hour_of_day_errors(self):
+        '''
+            MAPE of the predictions for every hour of the day. The backend
+            keeps a single prediction per hour and no forecast issue times,
+            so errors by lead time cannot be told apart.
+        '''
+        with np.errstate(divide='ignore', invalid='ignore'):
+            errors = np.abs(self.real - self.predicted) / self.real * 100
+        #the percentage error is undefined when the real aqi is 0
+        matched = np.isfinite(errors)
+
+        hours = (self.start + np.flatnonzero(matched)) % 24
+        counts = np.bincount(hours, minlength=24)
+        totals = np.bincount(hours, weights=errors[matched], minlength=24)
+        return pd.DataFrame({
+            'hour':
+                np.arange(24),
+            'mape':
+                np.where(counts > 0, totals / np.maximum(counts, 1), np.nan),
+            'hours':
+                counts,
+        })
+
+    def to_frame(self, how='outer'):
+        '''
+            Dataframe with date_time, aqi and aqi_pred on the hours that have
+            a real or a predicted value ('outer'), both ('inner'), or only
+            the predicted values ('predicted')
+        '''
+        has_real = ~np.isnan(self.real)
+        has_pred = ~np.isnan(self.predicted)
+        keep = {
+            'outer': has_real | has_pred,
+            'inner': has_real & has_pred,
+            'predicted': has_pred,
+        }[how]
+        offsets = np.flatnonzero(keep)
+        df = pd.DataFrame({'date_time': _to_datetime(self.start + offsets)})
+        if how != 'predicted':
+            df['aqi'] = self.real[offsets]
+        df['aqi_pred'] = self.predicted[offsets]
+        return df
+
+
+def _epoch_hours(date_time):
+    '''
+        int32 hours since the epoch of datetime values
+    '''
+    hours = np.asarray(date_time).astype('datetime64[h]')
+    return hours.astype(np.int64).astype(np.int32)
+
+
+def _to_datetime(hours):
+    '''
+        datetime64[ns] values of hours since the epoch
+    '''
+    return np.asarray(
+        hours, dtype=np.int64).astype('datetime64[h]').astype('datetime64[ns]')
+
+
+def _to_hour(timestamp):
+    '''
+        Hours since the epoch of a timestamp, rounded up to a whole hour
+    '''
+    hour = np.datetime64(pd.Timestamp(timestamp).ceil('H'), 'h')
+    return np.int32(hour.astype(np.int64))
@@ -0,0 +1,132 @@
+'''
+    Local columnar store of the cleaned AQI series.
+    Refresh it from the backend with: python store.py refresh
+'''
+import argparse
+import os
+import threading
+
+import pyarrow as pa
+import pyarrow.ipc as ipc
+
+from env import store_dir, city as default_city, state as default_state
+from series import AQISeries
+
+#loaded series in their compact form, reused until the file on disk changes
+_loaded = {}
+_loaded_lock = threading.Lock()
+
+
+def series_path(kind, city, state):
+    '''
+        Path of the file holding one series of a city
+    '''
+    return os.path.join(store_dir,
+                        f"{kind}_{city.lower()}_{state.lower()}.arrow")
+
+
+def save_series(kind, city, state, df):
+    '''
+        Write a cleaned dataframe to the store
+    '''
+    os.makedirs(store_dir, exist_ok=True)
+    path = series_path(kind, city, state)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+
+    #write to a temporary file first so readers never see half a file
+    tmp_path = f"{path}.tmp"
+    with pa.OSFile(tmp_path, 'wb') as sink:
+        with ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
+
+
+def load_compact(kind, city, state):
+    '''
+        Read a series from the store as an AQISeries, None if it is not
+        there. The file is memory mapped and only converted again when it
+        changes, the series is shared and must not be modified.
+    '''
+    path = series_path(kind, city, state)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+    with _loaded_lock:
+        cached = _loaded.get(path)
+        if cached is None or cached[0] != mtime:
+            with pa.memory_map(path, 'r') as source:
+                df = ipc.open_file(source).read_all().to_pandas()
+            cached = (mtime, (kind, city.lower(), state.lower()),
+                      AQISeries.from_frame(df))
+            _loaded[path] = cached
+    return cached[2]
+
+
+def series_footprint(series, kind, city, state, source):
+    '''
+        Rows and bytes of one series, next to what the same data takes as
+        a dataframe
+    '''
+    return {
+        'city':
+            city,
+        'state':
+            state,
+        'kind':
+            kind,
+        'source':
+            source,
+        'rows':
+            len(series),
+        'bytes':
+            series.nbytes,
+        'dataframe_bytes':
+            int(series.to_frame().memory_usage(index=True, deep=True).sum()),
+    }
+
+
+def memory_footprint():
+    '''
+        Rows and bytes held in memory by every series loaded from the store
+    '''
+    with _loaded_lock:
+        loaded = [(key, series) for _, key, series in _loaded.values()]
+    return [
+        series_footprint(series, kind, city, state, 'store')
+        for (kind, city, state), series in sorted(loaded, key=lambda x: x[0])
+    ]
+
+
+def refresh(city, state):
+    '''
+        Sync the store of a city from the backend
+    '''
+    #imported here, the store itself must not need the backend client
+    from api_connector import (get_real_time_aqi, get_predicted_aqi,
+                               clean_real_time_aqi, clean_prediction_data)
+
+    df, _, _, _ = clean_real_time_aqi(get_real_time_aqi(city, state), None,
+                                      None)
+    df_pred = clean_prediction_data(get_predicted_aqi(city, state))
+    if df is None or df_pred is None:
+        raise SystemExit(f"Could not fetch the data of {city}, {state}.")
+    save_series('real_time', city, state, df)
+    save_series('predicted', city, state, df_pred)
+    print(f"Stored {len(df)} real time and {len(df_pred)} predicted rows "
+          f"for {city}, {state} in {store_dir}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('command', choices=['refresh'])
+    parser.add_argument('--city', default=default_city)
+    parser.add_argument('--state', default=default_state)
+    args = parser.parse_args()
+    if args.command == 'refresh':
+        refresh(args.city, args.state)
+
+
+if __name__ == '__main__':
+    main()
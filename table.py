@@ -0,0 +1,63 @@
+import math
+
+import pandas as pd
+import streamlit as st
+
+from env import table_page_size, table_max_rows
+
+
+def _for_display(df):
+    '''
+        Readable copy of a page, dates formatted like everywhere in the app
+    '''
+    df = df.copy()
+    for column in df.columns:
+        if pd.api.types.is_datetime64_any_dtype(df[column]):
+            df[column] = df[column].dt.strftime('%d-%m-%Y %H:%M')
+    return df
+
+
+def paged_dataframe(df, key, page_size=table_page_size):
+    '''
+        Show a dataframe one page at a time. Sorting and filtering run on
+        the server, only the rows of the current page are sent to the browser.
+    '''
+    page_size = min(page_size, table_max_rows)
+    sort_column, order_column, filter_column = st.columns(3)
+    sort_by = sort_column.selectbox("Sort by", ["(none)", *df.columns],
+                                    key=f"{key}_sort")
+    descending = order_column.selectbox("Order", ["Ascending", "Descending"],
+                                        key=f"{key}_order") == "Descending"
+    text = filter_column.text_input("Filter", key=f"{key}_filter")
+
+    view = df
+    if text:
+        #match the text in any column holding labels
+        matches = pd.Series(False, index=df.index)
+        for column in df.columns:
+            if (pd.api.types.is_object_dtype(df[column]) or
+                    pd.api.types.is_categorical_dtype(df[column])):
+                matches |= df[column].astype(str).str.contains(text,
+                                                               case=False,
+                                                               regex=False)
+        view = view[matches]
+    if sort_by != "(none)":
+        view = view.sort_values(sort_by, ascending=not descending)
+
+    pages = max(1, math.ceil(len(view) / page_size))
+    page = 1
+    if pages > 1:
+        #the page lives in session state only, so it can be clamped when a
+        #filter or sort left fewer pages than the stored one
+        page_key = f"{key}_page"
+        st.session_state[page_key] = min(st.session_state.get(page_key, 1),
+                                         pages)
+        page = st.number_input("Page",
+                               min_value=1,
+                               max_value=pages,
+                               key=page_key)
+    page = min(max(int(page), 1), pages)
+    start = (page - 1) * page_size
+    st.dataframe(_for_display(view.iloc[start:start + page_size]))
+    st.caption(f"Rows {min(start + 1, len(view))}-"
+               f"{min(start + page_size, len(view))} of {len(view)}")
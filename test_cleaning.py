@@ -0,0 +1,57 @@
+'''
+    The vectorized cleaning and classification match the row by row
+    reference implementations kept in benchmark.py.
+    Run with: python -m pytest
+'''
+import pandas as pd
+
+from api_connector import (clean_real_time_aqi, clean_prediction_data,
+                           format_for_display, classify_aqi)
+from benchmark import (make_payload, legacy_clean_real_time_aqi,
+                       legacy_clean_prediction_data, legacy_get_aqi_class)
+
+
+def by_time(df):
+    '''
+        Rows of a formatted dataframe ordered by time. The reference
+        prediction cleaning sorts the formatted strings, which puts days
+        before months.
+    '''
+    hours = pd.to_datetime(df['date_time'], format='%d-%m-%Y %H:%M')
+    return df.iloc[hours.argsort(kind='stable')].reset_index(drop=True)
+
+
+def test_clean_real_time_aqi():
+    #shaped like the static Nov-Dec 2022 backend data, readings arrive a few
+    #seconds after the hour
+    real = make_payload(36 * 24, 'aqi')
+    for row in real['data']:
+        row['datetime'] = row['datetime'][:-2] + '17'
+
+    expected = legacy_clean_real_time_aqi(real)
+    actual, _, _, _ = clean_real_time_aqi(real, None, None)
+    pd.testing.assert_frame_equal(by_time(format_for_display(actual)),
+                                  by_time(expected))
+
+
+def test_clean_prediction_data():
+    pred = make_payload(38 * 24, 'yhat')
+
+    expected = legacy_clean_prediction_data(pred)
+    actual = clean_prediction_data(pred)
+    pd.testing.assert_frame_equal(by_time(format_for_display(actual)),
+                                  by_time(expected))
+
+
+def test_clean_prediction_data_is_ordered_by_time():
+    actual = clean_prediction_data(make_payload(38 * 24, 'yhat'))
+    assert actual['date_time'].is_monotonic_increasing
+
+
+def test_classify_aqi():
+    #every breakpoint and the values around it
+    aqi = pd.Series(
+        [0, 49.9, 50, 50.1, 100, 100.5, 200, 201, 300, 300.2, 400, 400.1, 999])
+    expected = aqi.apply(legacy_get_aqi_class)
+    actual = pd.Series(classify_aqi(aqi)).astype(str)
+    pd.testing.assert_series_equal(actual, expected)
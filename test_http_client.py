@@ -0,0 +1,58 @@
+'''
+    Decoding backend payloads while the body arrives in chunks.
+    Run with: python -m pytest
+'''
+import json
+
+import pytest
+
+from http_client import decode_json_stream
+
+PAYLOADS = [
+    {
+        'data': [{
+            'datetime': '21/11/2022 00:00:00',
+            'aqi': 123.456
+        }, {
+            'datetime': '21/11/2022 01:00:00',
+            'aqi': 98.7
+        }]
+    },
+    {
+        'data': [12345683, -7, 1.5e10, True, None, "x,y]", 'Ünï']
+    },
+    {
+        'data': [],
+        'count': 0
+    },
+    {
+        'detail': 'not found'
+    },
+]
+
+
+def chunked(body, size):
+    return [body[i:i + size] for i in range(0, len(body), size)]
+
+
+@pytest.mark.parametrize('payload', PAYLOADS)
+@pytest.mark.parametrize('size', [1, 5, 7, 65536])
+def test_decode_json_stream(payload, size):
+    body = json.dumps(payload).encode()
+    assert decode_json_stream(chunked(body, size)) == payload
+
+
+@pytest.mark.parametrize('size', range(1, 9))
+def test_number_cut_at_a_chunk_boundary(size):
+    #long numbers past the first 64 characters, which are read before the
+    #rows are decoded, so some of them end up cut between two chunks
+    payload = {'data': [12345683 + i for i in range(20)]}
+    body = json.dumps(payload).encode()
+    assert decode_json_stream(chunked(body, size)) == payload
+
+
+@pytest.mark.parametrize('cut', [3, 12, 15, 30])
+def test_truncated_body(cut):
+    body = json.dumps(PAYLOADS[0]).encode()[:cut]
+    with pytest.raises(ValueError):
+        decode_json_stream(chunked(body, 5))